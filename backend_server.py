@@ -1,13 +1,311 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+import codecs
 import subprocess
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
 import json
 
+import catalog
+import index_store
+import retrieval_filters
+from single_flight import SingleFlight
+from upload_stream import UploadProgress, new_upload_id, receive_files
+
 app = Flask(__name__, static_folder='frontend/dist')
 CORS(app)
 
+# Must match query_debate.STREAM_MARKER and query_debate.EXIT_FALLBACK
+DEBATE_STREAM_MARKER = '<<<DEBATE>>>'
+DEBATE_FALLBACK_EXIT = 3
+FALLBACK_NOTE = '\n\n(The LLM was not available; this debate was assembled from your documents.)'
+
+# Streamed LLM debates open with an extractive preview, framed by these
+PREVIEW_HEADER = 'PREVIEW (extracted from your documents while the full debate is generated):\n\n'
+PREVIEW_FOOTER = '\n\n--- FULL DEBATE ---\n\n'
+
+# Identical concurrent debate requests share one generation
+debate_flight = SingleFlight()
+
+# Beyond this many distinct LLM generations in flight, requests that did not
+# ask for a specific mode get the extractive (no-LLM) debate instead
+MAX_LLM_GENERATIONS = int(os.environ.get('MAX_LLM_GENERATIONS', '2'))
+
+def is_llm_generation(key):
+    """True for debate_key()s of LLM generations"""
+    return key[3] == 'llm'
+
+def choose_mode(data, topic, notebook_id, filters=None):
+    """Pick the debate mode for a request, degrading to extractive under load"""
+    mode = data.get('mode')
+    if mode in ('llm', 'extractive'):
+        return mode
+    # Joining an identical LLM generation costs nothing extra
+    if debate_flight.running(debate_key(topic, notebook_id, 'llm', filters)):
+        return 'llm'
+    if debate_flight.in_flight(is_llm_generation) >= MAX_LLM_GENERATIONS:
+        return 'extractive'
+    return 'llm'
+
+def normalize_topic(topic):
+    """Normalize a topic so trivially different spellings coalesce"""
+    return ' '.join(topic.split()).casefold()
+
+def index_version():
+    """Identify the current state of the vector database"""
+    return index_store.current_version('chroma_db')
+
+# Streaming uploads: files are extracted and embedded by this pool while the
+# rest of the request body is still arriving
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', '2'))
+ingest_executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS)
+upload_progress = UploadProgress()
+
+def get_embeddings():
+    """Shared embeddings model for in-process ingestion and extractive debates
+    
+    Concurrent requests embed their queries in shared batches.
+    """
+    import embedding_service
+    return embedding_service.get_embeddings(batch_queries=True)
+
+def prepare_uploaded_file(upload_id, name, path, sha256):
+    """Extract, chunk and embed one uploaded file (runs on ingest_executor)"""
+    from create_database import prepare_file
+    upload_progress.update_file(upload_id, name, status='embedding')
+    document_catalog.set_status(name, catalog.STATUS_INDEXING)
+    prepared = prepare_file(path, get_embeddings(), sha256=sha256)
+    upload_progress.update_file(
+        upload_id, name,
+        status='embedded',
+        pages=prepared['pages'],
+        chunks=len(prepared['chunks'])
+    )
+    return prepared
+
+def rebuild_database(uploaded_files):
+    """
+    Rebuild the index with create_database.py after a legacy upload
+    
+    Returns None on success, or the error message. The uploaded files are
+    marked as failed in the catalog if the build did not succeed.
+    """
+    cmd = [sys.executable, 'create_database.py']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode == 0:
+        return None
+    error = (result.stderr.strip().splitlines() or ['Failed to create database'])[-1]
+    for name in uploaded_files:
+        document_catalog.set_status(name, catalog.STATUS_ERROR, error)
+    return error
+
+# Document listings are served from the catalog instead of scanning data/
+document_catalog = catalog.DocumentCatalog()
+document_catalog.reconcile('data')
+
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+def list_catalog_documents(notebook_id, to_json):
+    """
+    Serve a page of the document catalog with ETag support
+    
+    Without page/per_page query parameters every document is returned, as
+    before. The ETag changes whenever the catalog does, so pollers get a
+    304 until something is uploaded or indexed.
+    """
+    paginated = 'page' in request.args or 'per_page' in request.args
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', DEFAULT_PER_PAGE, type=int), 1), MAX_PER_PAGE)
+    
+    etag = f'{document_catalog.generation()}-{notebook_id or "*"}-{page if paginated else 0}-{per_page}'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    
+    if paginated:
+        rows, total = document_catalog.list_documents(notebook_id, (page - 1) * per_page, per_page)
+    else:
+        rows, total = document_catalog.list_documents(notebook_id)
+    
+    payload = {
+        'success': True,
+        'documents': [to_json(row) for row in rows],
+        'total': total
+    }
+    if paginated:
+        payload.update(page=page, perPage=per_page)
+    
+    response = jsonify(payload)
+    response.set_etag(etag)
+    return response
+
+def debate_key(topic, notebook_id, mode, filters=None):
+    # Keep mode at index 3, see is_llm_generation()
+    filter_key = json.dumps(filters, sort_keys=True) if filters else None
+    return (normalize_topic(topic), notebook_id, index_version(), mode, filter_key)
+
+def debate_command(topic, mode, filters, stream=False):
+    cmd = [sys.executable, 'query_debate.py', topic, '--mode', mode]
+    if stream:
+        cmd.append('--stream')
+    if filters:
+        cmd += ['--filter', json.dumps(filters)]
+    return cmd
+
+# 10 minute timeout for LLM startup and generation
+DEBATE_TIMEOUT_SECONDS = 600
+
+def run_extractive_debate(topic, filters=None):
+    """Build an extractive debate in this process and return the response payload"""
+    from query_debate import DebateError, extractive_debate
+    try:
+        return {
+            'success': True,
+            'result': extractive_debate(topic, 'chroma_db', filters, get_embeddings()),
+            'mode': 'extractive',
+            'fallback': False
+        }
+    except DebateError as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Error generating debate: {str(e)}'
+        }
+
+def run_debate(topic, mode='llm', filters=None):
+    """Generate a debate for a topic and return the response payload
+    
+    Extractive debates are built in-process; LLM debates run query_debate.py.
+    An LLM debate that fell back to an extractive one because Ollama was not
+    available is reported with mode 'extractive' and fallback true.
+    """
+    if mode == 'extractive':
+        return run_extractive_debate(topic, filters)
+    
+    # Run the debate generation script with proper timeout
+    cmd = debate_command(topic, mode, filters)
+    
+    try:
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            timeout=DEBATE_TIMEOUT_SECONDS
+        )
+        
+        if result.returncode in (0, DEBATE_FALLBACK_EXIT):
+            # Extract just the debate part (skip the header info)
+            output_lines = result.stdout.split('\n')
+            debate_start = False
+            debate_content = []
+            
+            for line in output_lines:
+                if line.strip() == "="*60 and not debate_start:
+                    debate_start = True
+                    continue
+                elif debate_start:
+                    debate_content.append(line)
+            
+            debate_text = '\n'.join(debate_content).strip()
+            
+            fallback = result.returncode == DEBATE_FALLBACK_EXIT
+            return {
+                'success': True,
+                'result': debate_text,
+                'mode': 'extractive' if fallback else mode,
+                'fallback': fallback
+            }
+        else:
+            return {
+                'success': False,
+                'error': result.stderr.strip() or 'Failed to generate debate'
+            }
+            
+    except subprocess.TimeoutExpired:
+        return {
+            'success': False,
+            'error': 'Debate generation timed out. Try a simpler topic or check system resources.'
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': f'Error running debate generator: {str(e)}'
+        }
+
+def stream_debate(topic, mode='llm', filters=None):
+    """Yield the debate text for a topic as it is generated
+    
+    Extractive debates are built in-process and sent in one piece. LLM
+    debates run query_debate.py in streaming mode; while it loads, an
+    extractive preview is sent first.
+    """
+    if mode == 'extractive':
+        payload = run_extractive_debate(topic, filters)
+        yield payload['result'] if payload['success'] else f" {payload['error']}"
+        return
+    
+    cmd = debate_command(topic, mode, filters, stream=True)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    # The stream outlives disconnected clients, so a hung generation has to
+    # be killed here or it would hold its slot forever
+    deadline = threading.Timer(DEBATE_TIMEOUT_SECONDS, process.kill)
+    deadline.daemon = True
+    deadline.start()
+    
+    preview = run_extractive_debate(topic, filters)
+    if preview['success']:
+        yield PREVIEW_HEADER + preview['result'] + PREVIEW_FOOTER
+    
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    marker = DEBATE_STREAM_MARKER + '\n'
+    pending = ''
+    started = False
+    
+    try:
+        while True:
+            data = process.stdout.read1(4096)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if started:
+                if text:
+                    yield text
+                continue
+            
+            # Drop progress output until the marker line
+            pending += text.replace('\r\n', '\n')
+            pos = pending.find(marker)
+            if pos != -1:
+                started = True
+                rest = pending[pos + len(marker):]
+                pending = ''
+                if rest:
+                    yield rest
+        
+        tail = decoder.decode(b'', final=True)
+        if started and tail:
+            yield tail
+        returncode = process.wait()
+        if not deadline.is_alive() and returncode != 0:
+            yield '\n Debate generation timed out'
+        elif returncode == DEBATE_FALLBACK_EXIT:
+            yield FALLBACK_NOTE
+        elif not started:
+            # Failures after the marker were streamed by query_debate.py
+            yield '\n Error generating debate'
+    finally:
+        deadline.cancel()
+        if process.poll() is None:
+            process.kill()
+
 # API Routes (must be defined before frontend routes)
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
@@ -31,58 +329,29 @@ def generate_debate():
             })
         
         # Check if database exists
-        if not os.path.exists('chroma_db'):
+        if not index_store.has_index('chroma_db'):
             return jsonify({
                 'success': False,
                 'error': 'Database not found. Please run "python create_database.py" first.'
             })
         
-        # Run the debate generation script with proper timeout
-        cmd = [sys.executable, 'query_debate.py', topic]
-        
+        filters = data.get('filters')
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=600  # 10 minute timeout for LLM startup and generation
-            )
-            
-            if result.returncode == 0:
-                # Extract just the debate part (skip the header info)
-                output_lines = result.stdout.split('\n')
-                debate_start = False
-                debate_content = []
-                
-                for line in output_lines:
-                    if line.strip() == "="*60 and not debate_start:
-                        debate_start = True
-                        continue
-                    elif debate_start:
-                        debate_content.append(line)
-                
-                debate_text = '\n'.join(debate_content).strip()
-                
-                return jsonify({
-                    'success': True,
-                    'result': debate_text
-                })
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': result.stderr or 'Failed to generate debate'
-                })
-                
-        except subprocess.TimeoutExpired:
-            return jsonify({
-                'success': False,
-                'error': 'Debate generation timed out. Try a simpler topic or check system resources.'
-            })
-        except Exception as e:
+            retrieval_filters.parse_filters(filters)
+        except ValueError as e:
             return jsonify({
                 'success': False,
-                'error': f'Error running debate generator: {str(e)}'
+                'error': f'Invalid filters: {str(e)}'
             })
+        
+        notebook_id = data.get('notebookId', 'main')
+        mode = choose_mode(data, topic, notebook_id, filters)
+        payload, shared = debate_flight.do(
+            debate_key(topic, notebook_id, mode, filters),
+            lambda: run_debate(topic, mode, filters)
+        )
+        
+        return jsonify(dict(payload, shared=shared))
             
     except Exception as e:
         return jsonify({
@@ -90,6 +359,41 @@ def generate_debate():
             'error': f'Server error: {str(e)}'
         })
 
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_debate_stream():
+    """Stream a debate as plain text while it is being generated"""
+    data = request.get_json() or {}
+    topic = data.get('topic', '').strip()
+    
+    if not topic:
+        return jsonify({
+            'success': False,
+            'error': 'No topic provided'
+        })
+    
+    if not index_store.has_index('chroma_db'):
+        return jsonify({
+            'success': False,
+            'error': 'Database not found. Please run "python create_database.py" first.'
+        })
+    
+    filters = data.get('filters')
+    try:
+        retrieval_filters.parse_filters(filters)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid filters: {str(e)}'
+        })
+    
+    notebook_id = data.get('notebookId', 'main')
+    mode = choose_mode(data, topic, notebook_id, filters)
+    chunks = debate_flight.stream(
+        debate_key(topic, notebook_id, mode, filters),
+        lambda: stream_debate(topic, mode, filters)
+    )
+    return Response(stream_with_context(chunks), mimetype='text/plain')
+
 @app.route('/api/notebooks', methods=['GET'])
 def get_notebooks():
     """Get list of notebooks"""
@@ -168,35 +472,17 @@ def create_notebook():
 def get_notebook_documents(notebook_id):
     """Get documents for a specific notebook"""
     try:
-        documents = []
-        if os.path.exists('data'):
-            for file in os.listdir('data'):
-                if file.endswith('.pdf'):
-                    file_path = os.path.join('data', file)
-                    try:
-                        # Try to get file size and basic info
-                        size = os.path.getsize(file_path)
-                        documents.append({
-                            'id': file.replace('.pdf', ''),
-                            'name': file,
-                            'size': size,
-                            'type': 'PDF',
-                            'uploadedAt': '2025-12-27T00:00:00Z',
-                            'pages': 10  # Mock page count
-                        })
-                    except:
-                        documents.append({
-                            'id': file.replace('.pdf', ''),
-                            'name': file,
-                            'size': 0,
-                            'type': 'PDF',
-                            'uploadedAt': '2025-12-27T00:00:00Z',
-                            'pages': 0
-                        })
-        
-        return jsonify({
-            'success': True,
-            'documents': documents
+        return list_catalog_documents(notebook_id, lambda row: {
+            'id': row['name'].replace('.pdf', ''),
+            'name': row['name'],
+            'size': row['size'],
+            'type': 'PDF',
+            'uploadedAt': row['uploaded_at'],
+            'pages': row['pages'] or 0,
+            'chunks': row['chunks'] or 0,
+            'status': row['status'],
+            'contentHash': row['content_hash'],
+            'ingestedAt': row['ingested_at']
         })
     except Exception as e:
         return jsonify({
@@ -226,12 +512,20 @@ def upload_notebook_documents(notebook_id):
                 # Save file to data directory
                 file_path = os.path.join('data', file.filename)
                 file.save(file_path)
+                document_catalog.register_upload(
+                    file.filename, os.path.getsize(file_path), notebook_id, catalog.file_hash(file_path)
+                )
                 uploaded_files.append(file.filename)
         
         # Regenerate database after upload
         if uploaded_files:
-            cmd = [sys.executable, 'create_database.py']
-            subprocess.run(cmd, capture_output=True, text=True)
+            error = rebuild_database(uploaded_files)
+            if error:
+                return jsonify({
+                    'success': False,
+                    'files': uploaded_files,
+                    'error': f'Uploaded {len(uploaded_files)} files but indexing failed: {error}'
+                })
         
         return jsonify({
             'success': True,
@@ -249,29 +543,12 @@ def upload_notebook_documents(notebook_id):
 def get_documents():
     """Get list of documents in the data folder (legacy endpoint)"""
     try:
-        documents = []
-        if os.path.exists('data'):
-            for file in os.listdir('data'):
-                if file.endswith('.pdf'):
-                    file_path = os.path.join('data', file)
-                    try:
-                        # Try to get file size and basic info
-                        size = os.path.getsize(file_path)
-                        documents.append({
-                            'name': file,
-                            'size': size,
-                            'type': 'PDF'
-                        })
-                    except:
-                        documents.append({
-                            'name': file,
-                            'size': 0,
-                            'type': 'PDF'
-                        })
-        
-        return jsonify({
-            'success': True,
-            'documents': documents
+        return list_catalog_documents(None, lambda row: {
+            'name': row['name'],
+            'size': row['size'],
+            'type': 'PDF',
+            'pages': row['pages'] or 0,
+            'status': row['status']
         })
     except Exception as e:
         return jsonify({
@@ -301,12 +578,20 @@ def upload_documents():
                 # Save file to data directory
                 file_path = os.path.join('data', file.filename)
                 file.save(file_path)
+                document_catalog.register_upload(
+                    file.filename, os.path.getsize(file_path), content_hash=catalog.file_hash(file_path)
+                )
                 uploaded_files.append(file.filename)
         
         # Regenerate database after upload
         if uploaded_files:
-            cmd = [sys.executable, 'create_database.py']
-            subprocess.run(cmd, capture_output=True, text=True)
+            error = rebuild_database(uploaded_files)
+            if error:
+                return jsonify({
+                    'success': False,
+                    'files': uploaded_files,
+                    'error': f'Uploaded {len(uploaded_files)} files but indexing failed: {error}'
+                })
         
         return jsonify({
             'success': True,
@@ -320,6 +605,95 @@ def upload_documents():
             'error': f'Error uploading files: {str(e)}'
         })
 
+@app.route('/api/upload/stream', methods=['POST'])
+def upload_documents_stream():
+    """Upload PDFs as a streamed multipart body, indexing each file as soon as it lands
+    
+    Progress can be polled at /api/upload/progress/<uploadId> while the
+    request runs; pass the id in the X-Upload-Id header to know it upfront.
+    An optional X-File-Checksums header maps file names (as sent) to expected
+    SHA-256; a mismatching file is rejected without replacing the stored one.
+    """
+    upload_id = request.headers.get('X-Upload-Id') or new_upload_id()
+    notebook_id = request.args.get('notebookId', catalog.DEFAULT_NOTEBOOK)
+    try:
+        expected_checksums = json.loads(request.headers.get('X-File-Checksums', '{}'))
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid X-File-Checksums header'
+        })
+    
+    upload_progress.start(upload_id)
+    futures = {}
+    
+    def on_progress(name, received):
+        upload_progress.update_file(upload_id, name, status='uploading', bytes=received)
+    
+    def on_file(name, path, size, sha256, error):
+        if error:
+            upload_progress.update_file(upload_id, name, status='error', error=error)
+            return
+        upload_progress.update_file(upload_id, name, status='queued', bytes=size, sha256=sha256)
+        document_catalog.register_upload(name, size, notebook_id, sha256)
+        futures[name] = ingest_executor.submit(prepare_uploaded_file, upload_id, name, path, sha256)
+    
+    try:
+        from create_database import commit_prepared
+        
+        receive_files(
+            request.stream, request.content_type, 'data', on_file, on_progress,
+            expected_checksums=expected_checksums
+        )
+        
+        prepared = []
+        for name, future in futures.items():
+            try:
+                prepared.append(future.result())
+            except Exception as e:
+                upload_progress.update_file(upload_id, name, status='error', error=str(e))
+                document_catalog.set_status(name, catalog.STATUS_ERROR, str(e))
+        
+        version = None
+        if prepared:
+            upload_progress.set_status(upload_id, 'indexing')
+            try:
+                version = commit_prepared(prepared, get_embeddings())
+            except Exception as e:
+                for item in prepared:
+                    document_catalog.set_status(item['file'], catalog.STATUS_ERROR, str(e))
+                raise
+            for item in prepared:
+                upload_progress.update_file(upload_id, item['file'], status='indexed')
+        
+        upload_progress.set_status(upload_id, 'done')
+        return jsonify({
+            'success': True,
+            'uploadId': upload_id,
+            'message': f'Successfully indexed {len(prepared)} files',
+            'files': upload_progress.get(upload_id)['files'],
+            'indexVersion': version
+        })
+        
+    except Exception as e:
+        upload_progress.set_status(upload_id, 'error')
+        return jsonify({
+            'success': False,
+            'uploadId': upload_id,
+            'error': f'Error uploading files: {str(e)}'
+        })
+
+@app.route('/api/upload/progress/<upload_id>', methods=['GET'])
+def upload_progress_status(upload_id):
+    """Per-file progress of a streaming upload"""
+    progress = upload_progress.get(upload_id)
+    if progress is None:
+        return jsonify({
+            'success': False,
+            'error': 'Unknown upload id'
+        })
+    return jsonify(dict(progress, success=True))
+
 @app.route('/api/create_database', methods=['POST'])
 def create_database_endpoint():
     """Create database from uploaded documents"""
@@ -0,0 +1,258 @@
+"""
+Persistent document catalog
+
+SQLite table of every uploaded document with the facts ingestion
+discovers (page count, chunk count, content hash, ingest time, indexing
+status), so listing endpoints never have to scan or re-parse data/.
+
+Every write bumps a generation counter; readers use it as a cheap ETag.
+The database is shared by the server and the create_database.py
+subprocess, so it runs in WAL mode with a connection per operation.
+"""
+
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+CATALOG_PATH = os.environ.get('DOCUMENT_CATALOG', 'document_catalog.sqlite3')
+DEFAULT_NOTEBOOK = 'main'
+
+STATUS_PENDING = 'pending'
+STATUS_INDEXING = 'indexing'
+STATUS_INDEXED = 'indexed'
+STATUS_ERROR = 'error'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    notebook_id  TEXT NOT NULL,
+    name         TEXT NOT NULL,
+    size         INTEGER NOT NULL DEFAULT 0,
+    pages        INTEGER,
+    chunks       INTEGER,
+    content_hash TEXT,
+    status       TEXT NOT NULL,
+    error        TEXT,
+    uploaded_at  TEXT NOT NULL,
+    ingested_at  TEXT,
+    PRIMARY KEY (notebook_id, name)
+);
+CREATE INDEX IF NOT EXISTS documents_name ON documents (name);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', 0);
+"""
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _epoch(iso):
+    return int(datetime.strptime(iso, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc).timestamp())
+
+
+def file_hash(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentCatalog:
+    """SQLite-backed catalog of uploaded documents"""
+
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _bump(conn):
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'generation'")
+
+    def generation(self):
+        """Counter that changes whenever the catalog changes"""
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0]
+
+    def register_upload(self, name, size, notebook_id=DEFAULT_NOTEBOOK, content_hash=None):
+        """
+        Record a newly uploaded (not yet indexed) document
+
+        Re-uploading identical content keeps the document's first ingest
+        time; changed content is ingested anew.
+        """
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO documents (notebook_id, name, size, content_hash, status, uploaded_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (notebook_id, name) DO UPDATE SET
+                    size = excluded.size,
+                    content_hash = excluded.content_hash,
+                    status = excluded.status,
+                    error = NULL,
+                    uploaded_at = excluded.uploaded_at,
+                    ingested_at = CASE WHEN content_hash IS excluded.content_hash
+                        THEN ingested_at END
+                """,
+                (notebook_id, name, size, content_hash, STATUS_PENDING, _now())
+            )
+            self._bump(conn)
+
+    def set_status(self, name, status, error=None):
+        """Update the indexing status of a document in every notebook"""
+        with self._connect() as conn:
+            conn.execute(
+                'UPDATE documents SET status = ?, error = ? WHERE name = ?',
+                (status, error, name)
+            )
+            self._bump(conn)
+
+    def first_ingested(self, name, content_hash):
+        """
+        When this content of a document was first ingested
+
+        Returns:
+            Epoch seconds, or None if it has not been ingested yet
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                """
+                SELECT MIN(ingested_at) FROM documents
+                WHERE name = ? AND content_hash = ? AND ingested_at IS NOT NULL
+                """,
+                (name, content_hash)
+            ).fetchone()
+        return _epoch(row[0]) if row[0] else None
+
+    def mark_indexed(self, name, size, pages, chunks, content_hash, ingested_at=None):
+        """
+        Record the result of ingesting a document
+
+        A document keeps its first ingest time while its content is
+        unchanged; otherwise ingested_at (epoch seconds, default now) is
+        recorded. Documents that were never registered (e.g. copied into
+        data/ by hand) are added to the default notebook.
+        """
+        now = _now()
+        ingested = _iso(ingested_at) if ingested_at is not None else now
+        with self._connect() as conn:
+            updated = conn.execute(
+                """
+                UPDATE documents SET size = ?, pages = ?, chunks = ?, content_hash = ?,
+                    status = ?, error = NULL,
+                    ingested_at = CASE WHEN content_hash IS ? AND ingested_at IS NOT NULL
+                        THEN ingested_at ELSE ? END
+                WHERE name = ?
+                """,
+                (size, pages, chunks, content_hash, STATUS_INDEXED, content_hash, ingested, name)
+            ).rowcount
+            if not updated:
+                conn.execute(
+                    """
+                    INSERT INTO documents (notebook_id, name, size, pages, chunks, content_hash,
+                        status, uploaded_at, ingested_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (DEFAULT_NOTEBOOK, name, size, pages, chunks, content_hash, STATUS_INDEXED, now, ingested)
+                )
+            self._bump(conn)
+
+    def reconcile(self, data_dir):
+        """
+        Sync the catalog with the files in data_dir
+
+        Adds files the catalog does not know about as pending and drops
+        entries whose file is gone. Meant for startup, not per request.
+        """
+        on_disk = {}
+        if os.path.isdir(data_dir):
+            for file in os.listdir(data_dir):
+                if file.endswith('.pdf'):
+                    on_disk[file] = os.path.getsize(os.path.join(data_dir, file))
+
+        with self._connect() as conn:
+            known = {row['name'] for row in conn.execute('SELECT DISTINCT name FROM documents')}
+            missing = known - set(on_disk)
+            added = set(on_disk) - known
+            for name in missing:
+                conn.execute('DELETE FROM documents WHERE name = ?', (name,))
+            for name in added:
+                conn.execute(
+                    """
+                    INSERT INTO documents (notebook_id, name, size, status, uploaded_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (DEFAULT_NOTEBOOK, name, on_disk[name], STATUS_PENDING, _now())
+                )
+            if missing or added:
+                self._bump(conn)
+
+    def sources_for_notebooks(self, notebook_ids):
+        """Names of the documents uploaded to any of the given notebooks"""
+        if not notebook_ids:
+            return []
+        placeholders = ', '.join('?' for _ in notebook_ids)
+        with self._connect() as conn:
+            return [
+                row['name'] for row in conn.execute(
+                    f'SELECT DISTINCT name FROM documents WHERE notebook_id IN ({placeholders})',
+                    list(notebook_ids)
+                )
+            ]
+
+    def list_documents(self, notebook_id=None, offset=0, limit=None):
+        """
+        List documents, optionally for one notebook
+
+        Without a notebook each file is listed once, using its most recent
+        upload, even if it was uploaded to several notebooks.
+
+        Returns:
+            Tuple of (list of row dicts, total count)
+        """
+        if notebook_id is not None:
+            count = 'SELECT COUNT(*) FROM documents WHERE notebook_id = ?'
+            query = 'SELECT * FROM documents WHERE notebook_id = ? ORDER BY name'
+            params = [notebook_id]
+        else:
+            count = 'SELECT COUNT(DISTINCT name) FROM documents'
+            # With a single MAX() aggregate, SQLite takes the other columns
+            # from the row holding the maximum
+            query = """
+                SELECT notebook_id, name, size, pages, chunks, content_hash, status,
+                    error, MAX(uploaded_at) AS uploaded_at, ingested_at
+                FROM documents GROUP BY name ORDER BY name
+            """
+            params = []
+
+        with self._connect() as conn:
+            total = conn.execute(count, params).fetchone()[0]
+            if limit is not None:
+                query += ' LIMIT ? OFFSET ?'
+                params += [limit, offset]
+            rows = [dict(row) for row in conn.execute(query, params)]
+        return rows, total
@@ -1,12 +1,228 @@
 from langchain_community.document_loaders import PyPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 import os
+import sys
+import time
+import uuid
+
+import catalog
+import dedup
+import embedding_service
+import index_store
+import retrieval_filters
+
+def make_text_splitter():
+    return RecursiveCharacterTextSplitter(
+        chunk_size=400,        # Reduced from 600 for faster processing
+        chunk_overlap=50,      # Reduced from 100 for better performance
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+def load_pdf(pdf_path, ingested_at=None):
+    """
+    Load the pages of one PDF, tagged with its file name and ingest time
+    
+    ingested_at (epoch seconds) defaults to now; pass the catalog's first
+    ingest time when re-indexing a file that was ingested before.
+    """
+    file = os.path.basename(pdf_path)
+    if ingested_at is None:
+        ingested_at = int(time.time())
+    pages = PyPDFLoader(pdf_path).load()
+    for page in pages:
+        page.metadata["source"] = file
+        page.metadata["ingested_at"] = ingested_at
+    return pages
+
+def prepare_file(pdf_path, embeddings, persist_directory="chroma_db", sha256=None):
+    """
+    Extract, chunk and embed one PDF without touching the index
+    
+    Used by the streaming upload so that each file is processed as soon as
+    it has been received; commit_prepared() then indexes the results.
+    Chunks the published index already has are not embedded again (see
+    _lookup_indexed); their vector is the stored one, or None. Pass the
+    file's SHA-256 if it is already known, to avoid reading it again.
+    """
+    sha256 = sha256 or catalog.file_hash(pdf_path)
+    ingested_at = catalog.DocumentCatalog().first_ingested(os.path.basename(pdf_path), sha256) or int(time.time())
+    pages = load_pdf(pdf_path, ingested_at)
+    chunks, stats = dedup.deduplicate(make_text_splitter().split_documents(pages))
+    vectors = [None] * len(chunks)
+    known = _lookup_indexed(chunks, embeddings, persist_directory)
+    misses = [i for i in range(len(chunks)) if i not in known]
+    if misses:
+        embedded = embeddings.embed_documents([chunks[i].page_content for i in misses])
+        for i, vector in zip(misses, embedded):
+            vectors[i] = vector
+    for i, vector in known.items():
+        vectors[i] = vector
+    stats["reused"] = len(known)
+    return {
+        "file": os.path.basename(pdf_path),
+        "size": os.path.getsize(pdf_path),
+        "content_hash": sha256,
+        "ingested_at": ingested_at,
+        "pages": len(pages),
+        "chunks": chunks,
+        "vectors": vectors,
+        "dedup": stats
+    }
+
+def _lookup_indexed(chunks, embeddings, persist_directory):
+    """
+    Find the chunks of a file that the published index already covers
+    
+    Returns a dict mapping chunk positions to the stored vector of an
+    identical indexed chunk, or to None for a near copy of one, which
+    commit_prepared() folds into the indexed chunk without needing a vector.
+    """
+    if not chunks:
+        return {}
+    lease = index_store.pin(persist_directory)
+    if lease is None:
+        return {}
+    try:
+        collection = Chroma(persist_directory=lease.path, embedding_function=embeddings)._collection
+        stored = {}
+        hashes = list({chunk.metadata["content_hash"] for chunk in chunks})
+        for batch in dedup._batches(hashes):
+            data = collection.get(
+                where={"content_hash": {"$in": batch}},
+                include=["metadatas", "embeddings"]
+            )
+            for metadata, vector in zip(data["metadatas"], data["embeddings"]):
+                stored[metadata["content_hash"]] = vector
+        
+        known = {}
+        minhash_index = dedup.load_minhash_index(lease.path)
+        for i, chunk in enumerate(chunks):
+            if chunk.metadata["content_hash"] in stored:
+                known[i] = stored[chunk.metadata["content_hash"]]
+            elif minhash_index is not None and minhash_index.find(dedup.minhash_signature(chunk.page_content)) is not None:
+                known[i] = None
+        return known
+    finally:
+        lease.release()
+
+def remove_files(vectordb, names):
+    """
+    Drop the chunks of files from a snapshot being built
+    
+    Chunks the files share with other files are kept, with the removed
+    files taken out of their provenance. Returns the vectors of the deleted
+    chunks keyed by content_hash, for reuse by unchanged chunks.
+    """
+    names = set(names)
+    collection = vectordb._collection
+    rows = {}
+    # Chunks found in the files first, and merged chunks that may list them
+    for where in ({"source": {"$in": sorted(names)}}, {"duplicate_count": {"$gt": 0}}):
+        data = collection.get(where=where, include=["metadatas"])
+        rows.update(zip(data["ids"], data["metadatas"]))
+    
+    deleted = []
+    updated = {}
+    for doc_id, metadata in rows.items():
+        remaining = dedup.remove_sources(metadata, names)
+        if remaining is None:
+            deleted.append(doc_id)
+        elif remaining != metadata:
+            updated[doc_id] = remaining
+    
+    reusable = {}
+    for batch in dedup._batches(deleted):
+        data = collection.get(ids=batch, include=["metadatas", "embeddings"])
+        for metadata, vector in zip(data["metadatas"], data["embeddings"]):
+            if metadata.get("content_hash"):
+                reusable[metadata["content_hash"]] = vector
+        collection.delete(ids=batch)
+    for batch in dedup._batches(list(updated)):
+        collection.update(ids=batch, metadatas=[updated[doc_id] for doc_id in batch])
+    return reusable
+
+def commit_prepared(prepared, embeddings, persist_directory="chroma_db"):
+    """
+    Add prepared files to a new index version and publish it
+    
+    Files that were indexed before are replaced: their old chunks are
+    removed first, so edited files do not keep stale chunks. Chunks are
+    deduplicated across the whole batch, and chunks whose content is
+    already indexed are folded into the existing chunk's provenance instead
+    of being added again. Returns the published version, or None if there
+    were no chunks.
+    """
+    # Embeddings were computed (or looked up) during upload; keep them
+    # attached to their chunk through deduplication
+    vector_of = {}
+    all_chunks = []
+    for item in prepared:
+        for chunk, vector in zip(item["chunks"], item["vectors"]):
+            vector_of[id(chunk)] = vector
+            all_chunks.append(chunk)
+    chunks, stats = dedup.deduplicate(all_chunks)
+    if not chunks:
+        return None
+    print(f"Deduplicated chunks: {stats}")
+    
+    # One builder at a time, from copying the base version to publishing,
+    # so concurrent uploads never drop each other's chunks
+    with index_store.build_lock(persist_directory):
+        base_version = index_store.current_version(persist_directory)
+        version, snapshot_path = index_store.new_snapshot(persist_directory, base_version=base_version)
+        try:
+            vectordb = Chroma(persist_directory=snapshot_path, embedding_function=embeddings)
+            reusable = remove_files(vectordb, [item["file"] for item in prepared])
+            new = dedup.fold_indexed_duplicates(vectordb, chunks, snapshot_path)
+            
+            # Chunks that were not embedded because the index covered them
+            # when they were prepared, but no longer does (replaced files, or
+            # a newer version published since)
+            unembedded = [c for c in new if vector_of[id(c)] is None]
+            for c in unembedded:
+                vector_of[id(c)] = reusable.get(c.metadata["content_hash"])
+            unembedded = [c for c in unembedded if vector_of[id(c)] is None]
+            if unembedded:
+                embedded = embeddings.embed_documents([c.page_content for c in unembedded])
+                for c, vector in zip(unembedded, embedded):
+                    vector_of[id(c)] = vector
+            
+            if new:
+                vectordb._collection.add(
+                    ids=[str(uuid.uuid4()) for _ in new],
+                    embeddings=[vector_of[id(c)] for c in new],
+                    metadatas=[c.metadata for c in new],
+                    documents=[c.page_content for c in new]
+                )
+            vectordb.persist()
+            retrieval_filters.build_filter_index(vectordb._collection, snapshot_path)
+            dedup.build_minhash_index(vectordb._collection, snapshot_path)
+        except Exception:
+            index_store.discard(persist_directory, version)
+            raise
+        
+        # Published even when every chunk was already indexed, so the
+        # merged provenance of re-uploads becomes visible
+        index_store.publish(persist_directory, version)
+        index_store.collect_garbage(persist_directory)
+    
+    document_catalog = catalog.DocumentCatalog()
+    for item in prepared:
+        document_catalog.mark_indexed(
+            item["file"], item["size"], item["pages"], len(item["chunks"]), item["content_hash"],
+            item["ingested_at"]
+        )
+    return version
 
 def create_database(pdf_folder="data", persist_directory="chroma_db"):
     """Create vector database from PDFs - 100% LOCAL"""
-    
+    # Hold the build lock from listing the PDFs to publishing, so a build
+    # started before another upload landed cannot publish over it
+    with index_store.build_lock(persist_directory):
+        return _build_database(pdf_folder, persist_directory)
+
+def _build_database(pdf_folder, persist_directory):
     # 1. Load PDFs
     documents = []
     pdf_files = [f for f in os.listdir(pdf_folder) if f.endswith(".pdf")]
@@ -16,50 +232,91 @@ def create_database(pdf_folder="data", persist_directory="chroma_db"):
         print("Please add PDF files to the 'data' folder and run this script again.")
         return None
     
+    document_catalog = catalog.DocumentCatalog()
+    page_counts = {}
+    ingested = {}  # file -> (content hash, ingest time)
     for file in pdf_files:
         pdf_path = os.path.join(pdf_folder, file)
         print(f"Loading {file}...")
         try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load()
-            for page in pages:
-                page.metadata["source"] = file
+            # Files ingested before keep their first ingest time, so date
+            # filters are not reset by every rebuild
+            content_hash = catalog.file_hash(pdf_path)
+            ingested_at = document_catalog.first_ingested(file, content_hash) or int(time.time())
+            pages = load_pdf(pdf_path, ingested_at)
             documents.extend(pages)
+            page_counts[file] = len(pages)
+            ingested[file] = (content_hash, ingested_at)
             print(f"  - Loaded {len(pages)} pages from {file}")
         except Exception as e:
             print(f"  - Error loading {file}: {e}")
+            document_catalog.set_status(file, catalog.STATUS_ERROR, str(e))
             continue
     
     if not documents:
         print("No documents were successfully loaded!")
         return None
     
+    for file in page_counts:
+        document_catalog.set_status(file, catalog.STATUS_INDEXING)
+    try:
+        return _index_documents(documents, page_counts, ingested, pdf_folder, persist_directory, document_catalog)
+    except Exception as e:
+        for file in page_counts:
+            document_catalog.set_status(file, catalog.STATUS_ERROR, str(e))
+        raise
+
+def _index_documents(documents, page_counts, ingested, pdf_folder, persist_directory, document_catalog):
     # 2. Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=400,        # Reduced from 600 for faster processing
-        chunk_overlap=50,      # Reduced from 100 for better performance
-        separators=["\n\n", "\n", " ", ""]
-    )
+    text_splitter = make_text_splitter()
     chunks = text_splitter.split_documents(documents)
     print(f"\nCreated {len(chunks)} chunks from {len(documents)} pages")
     
+    # Drop repeated chunks (re-uploaded files, overlapping course packs)
+    # before they are embedded
+    chunks, stats = dedup.deduplicate(chunks)
+    print(f"Kept {stats['kept']} unique chunks "
+          f"({stats['exact_duplicates']} exact and {stats['near_duplicates']} near duplicates removed)")
+    
     # 3. Create embeddings (LOCAL - no API)
     print("Loading local embeddings model (this may take a moment for first time)...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="all-MiniLM-L6-v2",  # Free, runs on CPU
-        model_kwargs={'device': 'cpu'}
-    )
+    embeddings = embedding_service.get_embeddings()
     
-    # 4. Create and save vector store
+    # 4. Create and save vector store in a new snapshot; readers keep using
+    # the current one until it is published
     print("Creating vector database...")
-    vectordb = Chroma.from_documents(
-        documents=chunks,
-        embedding=embeddings,
-        persist_directory=persist_directory
-    )
-    vectordb.persist()
-    print(f"✅ Database saved to {persist_directory}")
+    version, snapshot_path = index_store.new_snapshot(persist_directory)
+    try:
+        vectordb = Chroma.from_documents(
+            documents=chunks,
+            embedding=embeddings,
+            persist_directory=snapshot_path
+        )
+        vectordb.persist()
+        retrieval_filters.build_filter_index(vectordb._collection, snapshot_path)
+        dedup.build_minhash_index(vectordb._collection, snapshot_path)
+    except Exception:
+        index_store.discard(persist_directory, version)
+        raise
+    
+    # 5. Flip the manifest and drop snapshots nobody can read any more
+    index_store.publish(persist_directory, version)
+    removed = index_store.collect_garbage(persist_directory)
+    print(f"✅ Database saved to {persist_directory} (version {version})")
     print(f"✅ Database contains {vectordb._collection.count()} documents")
+    if removed:
+        print(f"Removed {len(removed)} old index version(s)")
+    
+    # 6. Record what was ingested in the document catalog
+    chunk_counts = {}
+    for chunk in chunks:
+        chunk_counts[chunk.metadata["source"]] = chunk_counts.get(chunk.metadata["source"], 0) + 1
+    for file, pages in page_counts.items():
+        content_hash, ingested_at = ingested[file]
+        document_catalog.mark_indexed(
+            file, os.path.getsize(os.path.join(pdf_folder, file)), pages, chunk_counts.get(file, 0),
+            content_hash, ingested_at
+        )
     return vectordb
 
 if __name__ == "__main__":
@@ -71,7 +328,7 @@ if __name__ == "__main__":
     
     result = create_database()
     
-    if result:
+    if result is not None:
         print("\n" + "="*60)
         print("✅ DATABASE CREATION COMPLETE!")
         print("="*60)
@@ -85,4 +342,5 @@ if __name__ == "__main__":
         print("Please check that:")
         print("1. The 'data' folder contains PDF files")
         print("2. All required packages are installed")
-        print("="*60)
\ No newline at end of file
+        print("="*60)
+        sys.exit(1)
\ No newline at end of file
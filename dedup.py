@@ -0,0 +1,342 @@
+"""
+Ingest-time chunk deduplication
+
+Drops chunks that repeat content already being indexed before they are
+embedded: exact duplicates by content hash, near-duplicates by MinHash
+signatures over word shingles with LSH banding to find candidate pairs.
+The first occurrence is kept as the canonical chunk and records where its
+duplicates came from.
+
+Chroma metadata values must be scalars, so merged provenance is stored as
+';'-separated strings:
+    sources:          "a.pdf;b.pdf"
+    pages:            "a.pdf:3;b.pdf:5"
+    duplicate_count:  number of chunks folded into this one
+
+Chunks added later are checked against the published index as well: exact
+matches by content_hash metadata, near matches through a companion file
+(minhash_index.npz) kept next to the filter index with the MinHash
+signature of every indexed chunk.
+"""
+
+import hashlib
+import os
+import zlib
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates
+NEAR_DUPLICATE_THRESHOLD = 0.85
+
+MINHASH_INDEX_NAME = "minhash_index.npz"
+
+# Chroma turns $in filters and id lookups into SQL parameters, which SQLite
+# caps, so long lists are sent in batches
+QUERY_BATCH_SIZE = 500
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; the
+# products stay within uint64 because a, b, x < 2**32
+_PRIME = 4294967311
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(1, 2**32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2**32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_text(text):
+    return " ".join(text.casefold().split())
+
+
+def content_hash(text):
+    """Hash of the normalized chunk text"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def minhash_signature(text):
+    """MinHash signature of the word shingles of a chunk"""
+    words = normalize_text(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode("utf-8")) for s in set(shingles)),
+        dtype=np.uint64
+    )
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME
+    return permuted.min(axis=0)
+
+
+def _band_keys(signature):
+    rows = NUM_PERMUTATIONS // BANDS
+    return [
+        (band, signature[band * rows:(band + 1) * rows].tobytes())
+        for band in range(BANDS)
+    ]
+
+
+def _batches(items):
+    for start in range(0, len(items), QUERY_BATCH_SIZE):
+        yield items[start:start + QUERY_BATCH_SIZE]
+
+
+def _page_ref(metadata):
+    return f"{metadata.get('source', 'Unknown')}:{metadata.get('page', 0)}"
+
+
+def _split(value):
+    return [part for part in (value or "").split(";") if part]
+
+
+def merge_metadata(canonical, duplicate):
+    """Record the provenance of a duplicate chunk on its canonical chunk"""
+    sources = _split(canonical.get("sources")) or [canonical.get("source", "Unknown")]
+    pages = _split(canonical.get("pages")) or [_page_ref(canonical)]
+
+    for source in _split(duplicate.get("sources")) or [duplicate.get("source", "Unknown")]:
+        if source not in sources:
+            sources.append(source)
+    for page in _split(duplicate.get("pages")) or [_page_ref(duplicate)]:
+        if page not in pages:
+            pages.append(page)
+
+    canonical["sources"] = ";".join(sources)
+    canonical["pages"] = ";".join(pages)
+    canonical["duplicate_count"] = (
+        canonical.get("duplicate_count", 0) + duplicate.get("duplicate_count", 0) + 1
+    )
+
+
+def remove_sources(metadata, names):
+    """
+    Drop the provenance of some source files from a chunk
+
+    Args:
+        metadata: Metadata of an indexed chunk
+        names: File names being removed (e.g. replaced by a re-upload)
+
+    Returns:
+        Updated copy of the metadata, or None if only those files contained
+        the chunk. A chunk whose own source is removed takes the source and
+        page of its next remaining occurrence.
+    """
+    sources = _split(metadata.get("sources")) or [metadata.get("source", "Unknown")]
+    pages = _split(metadata.get("pages")) or [_page_ref(metadata)]
+    kept_sources = [source for source in sources if source not in names]
+    if not kept_sources:
+        return None
+    kept_pages = [page for page in pages if page.rsplit(":", 1)[0] not in names]
+
+    metadata = dict(metadata)
+    if metadata.get("source") in names:
+        if kept_pages:
+            source, page = kept_pages[0].rsplit(":", 1)
+            metadata["page"] = int(page)
+        else:
+            source = kept_sources[0]
+        metadata["source"] = source
+    metadata["sources"] = ";".join(kept_sources)
+    metadata["pages"] = ";".join(kept_pages)
+    metadata["duplicate_count"] = max(
+        metadata.get("duplicate_count", 0) - (len(pages) - len(kept_pages)), 0
+    )
+    return metadata
+
+
+def deduplicate(chunks, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """
+    Remove exact and near-duplicate chunks
+
+    Args:
+        chunks: LangChain Documents, in ingest order
+        threshold: Estimated Jaccard similarity above which two chunks are
+            considered the same
+
+    Returns:
+        Tuple of (kept chunks, stats dict). Kept chunks carry a
+        content_hash and the merged provenance of the chunks they replaced.
+    """
+    kept = []
+    by_hash = {}
+    signatures = []
+    buckets = {}
+    exact = near = 0
+
+    for chunk in chunks:
+        digest = content_hash(chunk.page_content)
+        if digest in by_hash:
+            merge_metadata(kept[by_hash[digest]].metadata, chunk.metadata)
+            exact += 1
+            continue
+
+        signature = minhash_signature(chunk.page_content)
+        band_keys = _band_keys(signature)
+
+        match = None
+        candidates = set()
+        for key in band_keys:
+            candidates.update(buckets.get(key, ()))
+        for index in sorted(candidates):
+            if np.mean(signatures[index] == signature) >= threshold:
+                match = index
+                break
+
+        if match is not None:
+            merge_metadata(kept[match].metadata, chunk.metadata)
+            by_hash[digest] = match
+            near += 1
+            continue
+
+        index = len(kept)
+        chunk.metadata["content_hash"] = digest
+        kept.append(chunk)
+        by_hash[digest] = index
+        signatures.append(signature)
+        for key in band_keys:
+            buckets.setdefault(key, []).append(index)
+
+    stats = {
+        "input": len(chunks),
+        "kept": len(kept),
+        "exact_duplicates": exact,
+        "near_duplicates": near,
+    }
+    return kept, stats
+
+
+def build_minhash_index(collection, path):
+    """
+    Write the MinHash index of a freshly built Chroma collection
+
+    Snapshots are built on a copy of the previous version, so signatures
+    already in the copied file are reused and only chunks added since are
+    hashed.
+
+    Args:
+        collection: Chroma collection (vectordb._collection)
+        path: Snapshot directory to write the MinHash index into
+    """
+    ids = list(collection.get(include=[])["ids"])
+
+    known = {}
+    index_path = os.path.join(path, MINHASH_INDEX_NAME)
+    if os.path.exists(index_path):
+        with np.load(index_path) as data:
+            known = dict(zip(data["ids"].tolist(), data["signatures"]))
+
+    missing = [doc_id for doc_id in ids if doc_id not in known]
+    for batch in _batches(missing):
+        data = collection.get(ids=batch, include=["documents"])
+        for doc_id, text in zip(data["ids"], data["documents"]):
+            known[doc_id] = minhash_signature(text or "")
+
+    signatures = np.array(
+        [known[doc_id] for doc_id in ids if doc_id in known],
+        dtype=np.uint64
+    ).reshape(-1, NUM_PERMUTATIONS)
+    tmp_path = os.path.join(path, MINHASH_INDEX_NAME + ".tmp.npz")
+    np.savez(
+        tmp_path,
+        ids=np.array([doc_id for doc_id in ids if doc_id in known], dtype=str),
+        signatures=signatures,
+    )
+    os.replace(tmp_path, index_path)
+
+
+class MinHashIndex:
+    """Loaded MinHash index of one snapshot, bucketed by LSH band"""
+
+    def __init__(self, path):
+        with np.load(os.path.join(path, MINHASH_INDEX_NAME)) as data:
+            self.ids = data["ids"]
+            self.signatures = data["signatures"]
+        self.buckets = {}
+        for row, signature in enumerate(self.signatures):
+            for key in _band_keys(signature):
+                self.buckets.setdefault(key, []).append(row)
+
+    def find(self, signature, threshold=NEAR_DUPLICATE_THRESHOLD):
+        """Id of an indexed chunk similar to the signature, or None"""
+        candidates = set()
+        for key in _band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        for row in sorted(candidates):
+            if np.mean(self.signatures[row] == signature) >= threshold:
+                return str(self.ids[row])
+        return None
+
+
+def load_minhash_index(path, collection=None):
+    """
+    MinHash index of a snapshot, or None if it has none
+
+    Snapshots built before MinHash indexes existed get one built first when
+    the collection is given.
+    """
+    if not os.path.exists(os.path.join(path, MINHASH_INDEX_NAME)):
+        if collection is None:
+            return None
+        build_minhash_index(collection, path)
+    return MinHashIndex(path)
+
+
+def fold_indexed_duplicates(vectorstore, documents, snapshot_path=None):
+    """
+    Merge documents whose content is already indexed into the existing chunk
+
+    Args:
+        vectorstore: Chroma store of the snapshot being built
+        documents: Deduplicated chunks (carrying content_hash) about to be added
+        snapshot_path: Directory of that snapshot; enables near-duplicate
+            matching against its MinHash index
+
+    Returns:
+        The documents that still need to be added
+    """
+    if not documents:
+        return documents
+
+    indexed = {}  # id -> metadata of the indexed chunk
+    id_of_hash = {}
+    hashes = list({doc.metadata["content_hash"] for doc in documents})
+    for batch in _batches(hashes):
+        existing = vectorstore.get(
+            where={"content_hash": {"$in": batch}},
+            include=["metadatas"]
+        )
+        for doc_id, meta in zip(existing["ids"], existing["metadatas"]):
+            indexed[doc_id] = meta
+            id_of_hash.setdefault(meta["content_hash"], doc_id)
+
+    matches = {}  # position in documents -> id of the indexed chunk
+    for i, doc in enumerate(documents):
+        if doc.metadata["content_hash"] in id_of_hash:
+            matches[i] = id_of_hash[doc.metadata["content_hash"]]
+
+    minhash_index = None
+    if snapshot_path is not None and len(matches) < len(documents):
+        minhash_index = load_minhash_index(snapshot_path, vectorstore._collection)
+    if minhash_index is not None:
+        for i, doc in enumerate(documents):
+            if i not in matches:
+                doc_id = minhash_index.find(minhash_signature(doc.page_content))
+                if doc_id is not None:
+                    matches[i] = doc_id
+        # Fetch the near matches the exact lookup did not return; the index
+        # may still list chunks deleted since it was written
+        missing = list({doc_id for doc_id in matches.values() if doc_id not in indexed})
+        for batch in _batches(missing):
+            existing = vectorstore.get(ids=batch, include=["metadatas"])
+            indexed.update(zip(existing["ids"], existing["metadatas"]))
+        matches = {i: doc_id for i, doc_id in matches.items() if doc_id in indexed}
+
+    if not matches:
+        return documents
+
+    for i, doc_id in matches.items():
+        merge_metadata(indexed[doc_id], documents[i].metadata)
+    updated = list({doc_id for doc_id in matches.values()})
+    for batch in _batches(updated):
+        vectorstore._collection.update(ids=batch, metadatas=[indexed[doc_id] for doc_id in batch])
+    return [doc for i, doc in enumerate(documents) if i not in matches]
@@ -0,0 +1,295 @@
+"""
+Shared local embedding service
+
+One place that builds the all-MiniLM-L6-v2 embeddings used for indexing
+and querying, so every caller gets the same vectors. The model can run on:
+
+    torch      default PyTorch CPU inference
+    quantized  PyTorch with int8 dynamic quantization of the Linear layers
+    onnx       ONNX Runtime (needs sentence-transformers>=3.2 and
+               optimum[onnxruntime])
+    stub       deterministic hashed bag-of-words vectors, no model at all;
+               for load tests only
+
+Optimized backends are checked against the torch reference once per
+backend and model; the result is cached in EMBEDDING_CHECK_CACHE, so later
+loads (every query_debate.py run) skip loading the reference model. A
+backend that drifted falls back to torch. Long-running processes that
+embed queries concurrently (the API server) can ask for a wrapper that
+collects concurrent embed_query calls into small batches, so one forward
+pass serves many requests; a lone query is embedded immediately.
+
+Configuration (environment):
+    EMBEDDING_BACKEND          torch | quantized | onnx | stub  (default torch)
+    EMBEDDING_THREADS          intra-op CPU threads          (default: library default)
+    EMBEDDING_VERIFY           1 to check optimized backends (default 1)
+    EMBEDDING_CHECK_CACHE      check results file  (default .embedding_check.json)
+    EMBEDDING_BATCH_WINDOW_MS  query batching window for get_embeddings(batch_queries=True),
+                               0 off                         (default 5)
+    EMBEDDING_MAX_BATCH        max queries per batch         (default 32)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+BACKENDS = ("torch", "quantized", "onnx", "stub")
+
+# all-MiniLM-L6-v2 output size
+DIMENSIONS = 384
+
+# Minimum cosine similarity to the torch vectors for a backend to be used
+MIN_CONSISTENCY = 0.99
+
+CHECK_CACHE_PATH = os.environ.get("EMBEDDING_CHECK_CACHE", ".embedding_check.json")
+
+SAMPLE_TEXTS = [
+    "The industrial revolution transformed manufacturing across Europe.",
+    "Renewable energy adoption depends on storage costs and grid capacity.",
+    "Critics argue that standardized testing narrows the curriculum.",
+    "Photosynthesis converts light energy into chemical energy in plants.",
+    "Central banks raise interest rates to bring inflation under control.",
+]
+
+
+def _threads():
+    value = os.environ.get("EMBEDDING_THREADS")
+    return int(value) if value else None
+
+
+class StubEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words embeddings for load tests"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            vector[int.from_bytes(digest[:4], "little") % DIMENSIONS] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+
+def load_embeddings(backend="torch", threads=None):
+    """
+    Build a new embeddings model on the given backend
+
+    Args:
+        backend: One of BACKENDS
+        threads: Intra-op CPU threads, None for the library default
+
+    Returns:
+        LangChain Embeddings
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
+
+    if backend == "stub":
+        return StubEmbeddings()
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    if backend == "onnx":
+        model_kwargs = {'device': 'cpu', 'backend': 'onnx'}
+        if threads:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = threads
+            model_kwargs['model_kwargs'] = {'session_options': options}
+        return HuggingFaceEmbeddings(model_name=MODEL_NAME, model_kwargs=model_kwargs)
+
+    embeddings = HuggingFaceEmbeddings(
+        model_name=MODEL_NAME,  # Free, runs on CPU
+        model_kwargs={'device': 'cpu'}
+    )
+    if backend == "quantized":
+        import torch
+        embeddings.client = torch.quantization.quantize_dynamic(
+            embeddings.client, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    return embeddings
+
+
+def check_consistency(candidate, reference, texts=SAMPLE_TEXTS):
+    """
+    Compare a backend's vectors with reference vectors for the same texts
+
+    Returns:
+        Dict with the minimum and mean cosine similarity and whether the
+        candidate passes MIN_CONSISTENCY
+    """
+    a = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "ok": bool(cosine.min() >= MIN_CONSISTENCY),
+    }
+
+
+def _check_key(backend):
+    return f"{backend}:{MODEL_NAME}"
+
+
+def cached_check(backend, path=CHECK_CACHE_PATH):
+    """Cached check_consistency() result for a backend, or None if never checked"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get(_check_key(backend))
+    except (OSError, ValueError):
+        return None
+
+
+def save_check(backend, result, path=CHECK_CACHE_PATH):
+    """Record a check_consistency() result for a backend"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    results[_check_key(backend)] = result
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that batches concurrent embed_query calls
+
+    Queries arriving within the batching window are embedded together in
+    one embed_documents call. A query with nobody queued behind it is
+    embedded right away, so single-query processes pay no window.
+    embed_documents itself passes straight through.
+    """
+
+    def __init__(self, inner, window_ms=5, max_batch=32):
+        self.inner = inner
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch and not (len(batch) == 1 and self._queue.empty()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                vectors = self.inner.embed_documents([text for text, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+
+_shared = None
+_batching = None
+_shared_lock = threading.Lock()
+
+
+def _build_from_environment():
+    backend = os.environ.get("EMBEDDING_BACKEND", "torch")
+    threads = _threads()
+    embeddings = load_embeddings(backend, threads)
+
+    if backend in ("quantized", "onnx") and os.environ.get("EMBEDDING_VERIFY", "1") == "1":
+        # Only the first load of a backend pays for the torch reference
+        reference = None
+        result = cached_check(backend)
+        if result is None:
+            reference = load_embeddings("torch", threads)
+            result = check_consistency(embeddings, reference)
+            save_check(backend, result)
+        if not result["ok"]:
+            print(f"Embedding backend '{backend}' drifted from torch "
+                  f"(min cosine {result['min_cosine']:.4f}); using torch instead")
+            embeddings = reference or load_embeddings("torch", threads)
+
+    return embeddings
+
+
+def get_embeddings(batch_queries=False):
+    """
+    Process-wide embeddings configured from the environment, loaded on first use
+
+    Args:
+        batch_queries: Wrap the model so concurrent embed_query calls share
+            a forward pass (see BatchingEmbeddings). Only worth it in
+            processes that serve many queries at once.
+    """
+    global _shared, _batching
+    with _shared_lock:
+        if _shared is None:
+            _shared = _build_from_environment()
+        if not batch_queries:
+            return _shared
+        if _batching is None:
+            window_ms = float(os.environ.get("EMBEDDING_BATCH_WINDOW_MS", "5"))
+            if window_ms <= 0:
+                return _shared
+            _batching = BatchingEmbeddings(
+                _shared,
+                window_ms=window_ms,
+                max_batch=int(os.environ.get("EMBEDDING_MAX_BATCH", "32"))
+            )
+        return _batching
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark embedding backends")
+    parser.add_argument("--backend", choices=("quantized", "onnx"), default="onnx", help="Backend to test")
+    parser.add_argument("--threads", type=int, default=_threads(), help="Intra-op CPU threads")
+    parser.add_argument("--texts", type=int, default=256, help="Texts to embed for the benchmark")
+    args = parser.parse_args()
+
+    reference = load_embeddings("torch", args.threads)
+    candidate = load_embeddings(args.backend, args.threads)
+    result = check_consistency(candidate, reference)
+    save_check(args.backend, result)
+    print(f"Consistency vs torch: {result}")
+
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] + f" ({i})" for i in range(args.texts)]
+    for name, embeddings in (("torch", reference), (args.backend, candidate)):
+        started = time.perf_counter()
+        embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - started
+        print(f"{name}: {len(texts) / elapsed:.1f} texts/s")
+
+
+if __name__ == "__main__":
+    main()
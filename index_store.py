@@ -0,0 +1,361 @@
+"""
+Versioned vector index snapshots
+
+Every build writes a fresh Chroma directory under <root>/versions/ and only
+becomes visible once the manifest pointer (<root>/CURRENT.json) is replaced
+atomically. Readers pin the version they opened with a lease file, so a
+rebuild never changes or deletes an index that is still being queried.
+
+Layout:
+    chroma_db/
+        CURRENT.json              {"version": ..., "history": [...]}
+        versions/<version>/       Chroma persist directory
+        leases/<version>/<id>     one file per active reader
+        leases/<version>/build    held by an unpublished build until publish
+        .build.lock               held by the one builder allowed at a time
+
+A root without a manifest but with a chroma.sqlite3 file is treated as a
+single legacy (unversioned) index.
+
+Builders (create_database.py, streaming uploads, RAGPipeline) must hold
+build_lock() from new_snapshot() until after publish(); otherwise two
+builds copying the same base would silently drop each other's documents.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MANIFEST_NAME = "CURRENT.json"
+VERSIONS_DIR = "versions"
+LEASES_DIR = "leases"
+LEGACY_VERSION = "legacy"
+BUILD_LEASE_NAME = "build"
+BUILD_LOCK_NAME = ".build.lock"
+
+# Published versions kept around after being superseded, for readers that
+# resolved the manifest just before it was flipped. The manifest history
+# holds the current version plus this many.
+KEEP_PREVIOUS = 2
+
+# Leases older than this are considered abandoned (longest query timeout is 600s)
+LEASE_TTL_SECONDS = 900
+
+
+def _manifest_path(root: str) -> str:
+    return os.path.join(root, MANIFEST_NAME)
+
+
+def read_manifest(root: str) -> dict:
+    """Return the manifest contents, or an empty manifest if none exists"""
+    try:
+        with open(_manifest_path(root), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"version": None, "history": []}
+
+
+def _write_manifest(root: str, manifest: dict):
+    """Replace the manifest atomically"""
+    tmp_path = os.path.join(root, f".{MANIFEST_NAME}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _manifest_path(root))
+
+
+def _is_legacy(root: str) -> bool:
+    return (
+        not os.path.exists(_manifest_path(root))
+        and os.path.exists(os.path.join(root, "chroma.sqlite3"))
+    )
+
+
+def version_path(root: str, version: str) -> str:
+    """Directory holding the Chroma files of a version"""
+    if version == LEGACY_VERSION:
+        return root
+    return os.path.join(root, VERSIONS_DIR, version)
+
+
+def current_version(root: str) -> Optional[str]:
+    """Version currently published at root, or None if there is no index"""
+    if _is_legacy(root):
+        return LEGACY_VERSION
+    return read_manifest(root).get("version")
+
+
+def has_index(root: str) -> bool:
+    """True if a published index exists at root"""
+    return current_version(root) is not None
+
+
+_VERSION_STAMP = "%Y%m%dT%H%M%S%f"
+
+
+def _new_version_id() -> str:
+    # Sortable by creation time, unique across concurrent builders
+    stamp = datetime.now(timezone.utc).strftime(_VERSION_STAMP)
+    return f"{stamp}-{uuid.uuid4().hex[:6]}"
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        return
+    # msvcrt only retries for ~10 seconds before giving up
+    while True:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            continue
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def build_lock(root: str):
+    """
+    Hold the cross-process lock that serializes index builds under root
+
+    Blocks until any other builder (in this or another process) is done.
+    Not reentrant: do not nest it for the same root.
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, BUILD_LOCK_NAME), "a+") as f:
+        _lock_file(f)
+        try:
+            yield
+        finally:
+            _unlock_file(f)
+
+
+def new_snapshot(root: str, base_version: Optional[str] = None) -> tuple:
+    """
+    Create a directory for a new index version
+
+    Args:
+        root: Index root directory
+        base_version: Existing version to copy as a starting point, for
+            incremental builds. None starts from an empty directory.
+
+    Returns:
+        Tuple of (version, path). The version is invisible to readers until
+        publish() is called, and protected from GC by a build lease until
+        then (or until the lease expires, if the builder died).
+    """
+    version = _new_version_id()
+    path = version_path(root, version)
+    os.makedirs(os.path.join(root, VERSIONS_DIR), exist_ok=True)
+    lease_dir = os.path.join(root, LEASES_DIR, version)
+    os.makedirs(lease_dir, exist_ok=True)
+    with open(os.path.join(lease_dir, BUILD_LEASE_NAME), "w") as f:
+        f.write(str(time.time()))
+
+    if base_version is None:
+        os.makedirs(path)
+    elif base_version == LEGACY_VERSION:
+        shutil.copytree(
+            root, path,
+            ignore=shutil.ignore_patterns(VERSIONS_DIR, LEASES_DIR, MANIFEST_NAME)
+        )
+    else:
+        shutil.copytree(version_path(root, base_version), path)
+    return version, path
+
+
+def publish(root: str, version: Optional[str]):
+    """
+    Atomically make version the current index
+
+    Publishing None clears the index without deleting any snapshot that a
+    reader may still be using.
+    """
+    manifest = read_manifest(root)
+    history = [v for v in manifest.get("history", []) if v != version]
+    if version is not None:
+        history.append(version)
+    # The manifest is read on every query, so only keep what GC protects;
+    # versions dropped here look like abandoned builds to GC and go once
+    # they are older than LEASE_TTL_SECONDS
+    history = history[-(KEEP_PREVIOUS + 1):]
+    os.makedirs(root, exist_ok=True)
+    _write_manifest(root, {
+        "version": version,
+        "published_at": datetime.now(timezone.utc).isoformat(),
+        "history": history,
+    })
+    if version is not None:
+        _release_build_lease(root, version)
+
+
+def _release_build_lease(root: str, version: str):
+    try:
+        os.remove(os.path.join(root, LEASES_DIR, version, BUILD_LEASE_NAME))
+    except OSError:
+        pass
+
+
+def discard(root: str, version: str):
+    """Delete an unpublished build (e.g. after it failed)"""
+    shutil.rmtree(version_path(root, version), ignore_errors=True)
+    shutil.rmtree(os.path.join(root, LEASES_DIR, version), ignore_errors=True)
+
+
+class Lease:
+    """A reader's pin on one index version, released on close"""
+
+    def __init__(self, root: str, version: str):
+        self.root = root
+        self.version = version
+        self.path = version_path(root, version)
+        lease_dir = os.path.join(root, LEASES_DIR, version)
+        os.makedirs(lease_dir, exist_ok=True)
+        self._lease_file = os.path.join(lease_dir, f"{os.getpid()}-{uuid.uuid4().hex}")
+        self._released = threading.Event()
+        self._lock = threading.Lock()
+        self._write()
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self._lease_file), exist_ok=True)
+        with open(self._lease_file, "w") as f:
+            f.write(str(time.time()))
+
+    def refresh(self):
+        """Extend the lease for long-running readers"""
+        with self._lock:
+            if self._released.is_set():
+                return
+            try:
+                os.utime(self._lease_file)
+            except OSError:
+                # Pruned as abandoned; take it again
+                try:
+                    self._write()
+                except OSError:
+                    pass
+
+    def keep_alive(self, interval: float = LEASE_TTL_SECONDS / 3) -> "Lease":
+        """
+        Refresh the lease in the background until it is released
+
+        For pins held indefinitely (e.g. a pipeline's live snapshot), which
+        would otherwise be pruned as abandoned after LEASE_TTL_SECONDS.
+        """
+        def run():
+            while not self._released.wait(interval):
+                self.refresh()
+
+        threading.Thread(target=run, daemon=True).start()
+        return self
+
+    def release(self):
+        with self._lock:
+            self._released.set()
+            try:
+                os.remove(self._lease_file)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def pin(root: str) -> Optional[Lease]:
+    """
+    Pin the current version for reading
+
+    Returns:
+        A Lease whose path points at the pinned Chroma directory, or None if
+        there is no index.
+    """
+    # Retry if the version is garbage-collected between reading the
+    # manifest and taking the lease
+    for _ in range(3):
+        version = current_version(root)
+        if version is None:
+            return None
+        lease = Lease(root, version)
+        if os.path.exists(lease.path):
+            return lease
+        lease.release()
+    return None
+
+
+def _active_leases(root: str, version: str, now: float) -> bool:
+    lease_dir = os.path.join(root, LEASES_DIR, version)
+    if not os.path.isdir(lease_dir):
+        return False
+    active = False
+    for name in os.listdir(lease_dir):
+        lease_file = os.path.join(lease_dir, name)
+        try:
+            if now - os.path.getmtime(lease_file) < LEASE_TTL_SECONDS:
+                active = True
+            else:
+                os.remove(lease_file)
+        except OSError:
+            continue
+    return active
+
+
+def collect_garbage(root: str, keep: int = KEEP_PREVIOUS) -> List[str]:
+    """
+    Delete snapshots no reader can reach any more
+
+    A version is kept if it is current, among the `keep` most recently
+    superseded ones, or still leased by a reader or by its (unpublished)
+    build. Call it with build_lock() held.
+
+    Returns:
+        Versions that were deleted
+    """
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    if not os.path.isdir(versions_dir):
+        return []
+
+    manifest = read_manifest(root)
+    current = manifest.get("version")
+    protected = set(manifest.get("history", [])[-(keep + 1):])
+    if current is not None:
+        protected.add(current)
+
+    now = time.time()
+    removed = []
+    for version in sorted(os.listdir(versions_dir)):
+        if version in protected:
+            continue
+        if _active_leases(root, version, now):
+            continue
+        try:
+            shutil.rmtree(version_path(root, version))
+        except OSError:
+            # Still open somewhere (e.g. on Windows); retry next time
+            continue
+        shutil.rmtree(os.path.join(root, LEASES_DIR, version), ignore_errors=True)
+        removed.append(version)
+    return removed
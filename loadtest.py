@@ -0,0 +1,479 @@
+"""
+Load-test harness for the Flask API
+
+Runs backend_server.py in a throwaway workspace against local stand-ins
+for the expensive dependencies, drives the API with a configurable mix of
+requests and arrival pattern, and reports throughput, latency percentiles
+and error rates per endpoint.
+
+Stand-ins:
+    - an Ollama-compatible HTTP stub (/api/generate) with configurable
+      time-to-first-token and token rate, wired in via OLLAMA_BASE_URL
+    - the 'stub' embedding backend (EMBEDDING_BACKEND=stub), so no model
+      is downloaded or run
+
+Examples:
+    python loadtest.py --pattern closed --concurrency 8 --duration 60
+    python loadtest.py --pattern poisson --rate 5 --mix generate=1
+    python loadtest.py --pattern burst --burst-size 30 --burst-interval 10 --topics 1
+    python loadtest.py --url http://127.0.0.1:5000 --mix documents=1,notebook_documents=1
+
+Debates that failed count as errors; LLM debates the server had to
+assemble without the LLM are counted as fallbacks.
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+TOPICS = [
+    "Remote work improves productivity",
+    "Nuclear power is essential for decarbonization",
+    "Standardized testing should be abolished",
+    "Social media does more harm than good",
+    "Universal basic income reduces poverty",
+    "Artificial intelligence will create more jobs than it destroys",
+    "Homework should be banned in primary schools",
+    "Cities should ban private cars from their centres",
+]
+
+SAMPLE_LINES = [
+    "Supporters argue that {topic} because evidence from several studies shows clear benefits.",
+    "Critics respond that {topic} ignores significant costs and risks for vulnerable groups.",
+    "Surveys report mixed results, with outcomes depending strongly on local context.",
+    "Historical examples suggest that policy design matters more than the principle itself.",
+    "Economists disagree on the long-term effects, citing different models and assumptions.",
+]
+
+STUB_RESPONSE = (
+    "PERSPECTIVE A: Supporting view\n"
+    "- Point 1 with evidence [Source: loadtest-0.pdf, Page 0]\n"
+    "- Point 2 with evidence [Source: loadtest-1.pdf, Page 0]\n\n"
+    "PERSPECTIVE B: Contrasting view\n"
+    "- Point 1 with evidence [Source: loadtest-2.pdf, Page 0]\n"
+    "- Point 2 with evidence [Source: loadtest-3.pdf, Page 0]\n\n"
+    "NEUTRAL SUMMARY: Both perspectives are supported by the documents."
+)
+
+
+# --- Ollama stub -----------------------------------------------------------
+
+def make_ollama_handler(ttft, token_rate, num_tokens):
+    """Request handler class speaking enough of the Ollama API for LangChain"""
+    tokens = (STUB_RESPONSE.replace("\n", " \n ").split(" ") * num_tokens)[:num_tokens]
+
+    class OllamaStubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json({"models": [{"name": "mistral:latest"}]})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path != "/api/generate":
+                self.send_error(404)
+                return
+
+            time.sleep(ttft)
+            interval = 1.0 / token_rate if token_rate > 0 else 0
+
+            if not request.get("stream", True):
+                time.sleep(interval * len(tokens))
+                self._send_json({"response": " ".join(tokens), "done": True})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                text = token if i == 0 else " " + token
+                self._write_chunk({"response": text, "done": False})
+                time.sleep(interval)
+            self._write_chunk({"response": "", "done": True, "eval_count": len(tokens)})
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _write_chunk(self, payload):
+            line = (json.dumps(payload) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+    return OllamaStubHandler
+
+
+def start_ollama_stub(port, ttft, token_rate, num_tokens):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_ollama_handler(ttft, token_rate, num_tokens))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# --- Test data and workspace ------------------------------------------------
+
+def make_pdf(lines):
+    """Minimal single-page PDF with one line of Helvetica text per entry"""
+    def escape(text):
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    content = "BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({escape(line)}) '" for line in lines) + " ET"
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents 4 0 R "
+        "/Resources << /Font << /F1 5 0 R >> >> >>",
+        f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    out += b"".join(f"{offset:010d} 00000 n \n".encode("ascii") for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return out
+
+
+def sample_pdf(index):
+    topic = TOPICS[index % len(TOPICS)]
+    lines = [line.format(topic=topic.lower()) for line in SAMPLE_LINES] * 6
+    return make_pdf([f"Reading {index}: {topic}"] + lines)
+
+
+def prepare_workspace(num_documents):
+    """Copy the app into a temp directory with generated PDFs and a built index"""
+    workspace = tempfile.mkdtemp(prefix="rag-loadtest-")
+    for path in glob.glob(os.path.join(REPO_DIR, "*.py")):
+        shutil.copy(path, workspace)
+    os.makedirs(os.path.join(workspace, "data"))
+    for i in range(num_documents):
+        with open(os.path.join(workspace, "data", f"loadtest-{i}.pdf"), "wb") as f:
+            f.write(sample_pdf(i))
+    return workspace
+
+
+def start_backend(workspace, port, env):
+    """Run backend_server's app from the workspace and wait until it answers"""
+    code = (
+        "import backend_server; "
+        f"backend_server.app.run(host='127.0.0.1', port={port}, threaded=True, debug=False)"
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=workspace, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Backend exited during startup")
+        try:
+            urllib.request.urlopen(url + "/api/test", timeout=1).read()
+            return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("Backend did not start within 60s")
+
+
+# --- Workload ----------------------------------------------------------------
+
+class Client:
+    """Issues one request of a given kind and reports (ok, detail)"""
+
+    def __init__(self, url, args):
+        self.url = url
+        self.args = args
+        self.topics = TOPICS[:max(1, args.topics)]
+        self._etags = threading.local()
+        self._upload_counter = 0
+        self._lock = threading.Lock()
+
+    def _request(self, method, path, body=None, headers=None):
+        request = urllib.request.Request(self.url + path, data=body, method=method, headers=headers or {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.args.timeout) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    def generate(self):
+        payload = {"topic": random.choice(self.topics)}
+        if self.args.mode != "auto":
+            payload["mode"] = self.args.mode
+        status, _, body = self._request(
+            "POST", "/api/generate", json.dumps(payload).encode("utf-8"),
+            {"Content-Type": "application/json"}
+        )
+        data = json.loads(body) if status == 200 else {}
+        if not data.get("success", False):
+            return False, "error"
+        # Record which engine served the request, so latencies of the LLM
+        # and extractive paths are never mixed up unnoticed
+        detail = data.get("mode")
+        if data.get("fallback"):
+            detail += ",fallback"
+        if data.get("shared"):
+            detail += ",shared"
+        return True, detail
+
+    def _list(self, path):
+        """GET a document listing, revalidating with this thread's last ETag"""
+        if not hasattr(self._etags, "by_path"):
+            self._etags.by_path = {}
+        etags = self._etags.by_path
+        headers = {}
+        if etags.get(path):
+            headers["If-None-Match"] = etags[path]
+        status, response_headers, body = self._request("GET", path, headers=headers)
+        if status == 304:
+            return True, "not_modified"
+        etags[path] = response_headers.get("ETag")
+        return status == 200 and json.loads(body).get("success", False), None
+
+    def documents(self):
+        return self._list("/api/documents")
+
+    def notebook_documents(self):
+        return self._list("/api/notebooks/main/documents")
+
+    def upload(self):
+        with self._lock:
+            index = self._upload_counter
+            self._upload_counter += 1
+        boundary = uuid.uuid4().hex
+        name = f"upload-{index}.pdf"
+        body = (
+            f"--{boundary}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{name}\"\r\n"
+            f"Content-Type: application/pdf\r\n\r\n"
+        ).encode("ascii") + sample_pdf(index) + f"\r\n--{boundary}--\r\n".encode("ascii")
+        status, _, response = self._request(
+            "POST", self.args.upload_endpoint, body,
+            {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+        )
+        return status == 200 and json.loads(response).get("success", False), None
+
+
+def parse_mix(value):
+    """'generate=6,documents=3,upload=1' -> list of (kind, weight)"""
+    mix = []
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ("generate", "documents", "notebook_documents", "upload"):
+            raise argparse.ArgumentTypeError(f"Unknown request kind: {kind}")
+        mix.append((kind, float(weight or 1)))
+    return mix
+
+
+class Recorder:
+    """Collects per-request results from worker threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = []
+
+    def run(self, client, kind, scheduled):
+        """Run one request; latency counts from its scheduled arrival time"""
+        try:
+            ok, detail = getattr(client, kind)()
+        except Exception as e:
+            ok, detail = False, type(e).__name__
+        with self._lock:
+            self.samples.append((kind, time.perf_counter() - scheduled, ok, detail))
+
+
+def drive(client, args):
+    """Generate load according to args.pattern for args.duration seconds"""
+    kinds = [kind for kind, _ in args.mix]
+    weights = [weight for _, weight in args.mix]
+    recorder = Recorder()
+    started = time.perf_counter()
+    deadline = started + args.duration
+
+    def pick():
+        return random.choices(kinds, weights)[0]
+
+    if args.pattern == "closed":
+        def worker():
+            while time.perf_counter() < deadline:
+                recorder.run(client, pick(), time.perf_counter())
+
+        threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        # Open loop: arrivals do not wait for earlier requests to finish
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            next_arrival = started
+            while next_arrival < deadline:
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                if args.pattern == "poisson":
+                    pool.submit(recorder.run, client, pick(), next_arrival)
+                    next_arrival += random.expovariate(args.rate)
+                else:
+                    for _ in range(args.burst_size):
+                        pool.submit(recorder.run, client, pick(), next_arrival)
+                    next_arrival += args.burst_interval
+
+    return recorder.samples, time.perf_counter() - started
+
+
+# --- Reporting -----------------------------------------------------------------
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """Per-kind and overall throughput, latency percentiles and error rates"""
+    groups = {}
+    for sample in samples:
+        groups.setdefault(sample[0], []).append(sample)
+    groups["all"] = samples
+
+    report = {}
+    for kind, group in groups.items():
+        latencies = sorted(latency for _, latency, _, _ in group)
+        errors = sum(1 for _, _, ok, _ in group if not ok)
+        fallbacks = sum(1 for _, _, _, detail in group if detail and "fallback" in detail.split(","))
+        details = {}
+        for _, _, _, detail in group:
+            if detail:
+                details[detail] = details.get(detail, 0) + 1
+        report[kind] = {
+            "requests": len(group),
+            "throughput_rps": len(group) / elapsed if elapsed else 0.0,
+            "errors": errors,
+            "error_rate": errors / len(group) if group else 0.0,
+            "fallbacks": fallbacks,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p90_ms": percentile(latencies, 0.90) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "max_ms": (latencies[-1] * 1000) if latencies else 0.0,
+            "details": details,
+        }
+    return report
+
+
+def print_report(report, elapsed, args):
+    print("=" * 96)
+    print(f"LOAD TEST: pattern={args.pattern} concurrency={args.concurrency} duration={elapsed:.1f}s")
+    print("=" * 96)
+    print(f"{'endpoint':<18} {'requests':>8} {'rps':>8} {'errors':>7} {'fallbk':>6} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, row in report.items():
+        print(f"{kind:<18} {row['requests']:>8} {row['throughput_rps']:>8.2f} {row['error_rate']:>6.1%} "
+              f"{row['fallbacks']:>6} "
+              f"{row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+        if row["details"]:
+            print(f"{'':<18} {row['details']}")
+    print("=" * 96)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the RAG debate API against local stubs")
+    parser.add_argument("--url", help="Test an already running server instead of starting one")
+    parser.add_argument("--pattern", choices=("closed", "poisson", "burst"), default="closed",
+                        help="closed: fixed number of looping clients; poisson: open-loop random "
+                             "arrivals at --rate; burst: --burst-size requests every --burst-interval")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clients (closed) or max in-flight requests")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load")
+    parser.add_argument("--rate", type=float, default=2.0, help="Mean arrivals per second (poisson)")
+    parser.add_argument("--burst-size", type=int, default=10)
+    parser.add_argument("--burst-interval", type=float, default=5.0)
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("generate=6,documents=2,notebook_documents=1,upload=1"),
+                        help="Weighted request mix of generate, documents, notebook_documents and "
+                             "upload, e.g. generate=6,documents=3,upload=1")
+    parser.add_argument("--topics", type=int, default=4,
+                        help="Distinct debate topics; fewer topics means more identical requests")
+    parser.add_argument("--mode", choices=("llm", "extractive", "auto"), default="llm",
+                        help="Debate mode to request; 'auto' lets the server degrade to extractive under load")
+    parser.add_argument("--upload-endpoint", default="/api/upload",
+                        choices=("/api/upload", "/api/upload/stream"))
+    parser.add_argument("--timeout", type=float, default=600, help="Per-request timeout in seconds")
+    parser.add_argument("--documents", type=int, default=4, help="PDFs to index before the test")
+    parser.add_argument("--port", type=int, default=5055, help="Port for the backend under test")
+    parser.add_argument("--ollama-port", type=int, default=11500, help="Port for the Ollama stub")
+    parser.add_argument("--ttft", type=float, default=0.5, help="Stub time to first token, seconds")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Stub tokens per second")
+    parser.add_argument("--tokens", type=int, default=120, help="Stub tokens per response")
+    parser.add_argument("--json", dest="json_path", help="Also write the report to this JSON file")
+    parser.add_argument("--keep-workspace", action="store_true", help="Do not delete the temp workspace")
+    args = parser.parse_args()
+
+    backend = workspace = ollama = None
+    try:
+        url = args.url
+        if url is None:
+            ollama = start_ollama_stub(args.ollama_port, args.ttft, args.token_rate, args.tokens)
+            env = dict(
+                os.environ,
+                OLLAMA_BASE_URL=f"http://127.0.0.1:{args.ollama_port}",
+                EMBEDDING_BACKEND="stub",
+                DOCUMENT_CATALOG="document_catalog.sqlite3",
+            )
+            workspace = prepare_workspace(args.documents)
+            print(f"Workspace: {workspace}")
+            print("Building index...")
+            subprocess.run([sys.executable, "create_database.py"], cwd=workspace, env=env,
+                           check=True, stdout=subprocess.DEVNULL)
+            backend, url = start_backend(workspace, args.port, env)
+            print(f"Backend running at {url}")
+
+        samples, elapsed = drive(Client(url.rstrip("/"), args), args)
+        report = summarize(samples, elapsed)
+        print_report(report, elapsed, args)
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({"config": {k: v for k, v in vars(args).items() if k != "mix"},
+                           "mix": dict(args.mix), "elapsed_s": elapsed, "report": report}, f, indent=2)
+    finally:
+        if backend is not None:
+            backend.terminate()
+            backend.wait()
+        if ollama is not None:
+            ollama.shutdown()
+        if workspace and not args.keep_workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
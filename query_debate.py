@@ -1,9 +1,37 @@
 import argparse
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.llms import Ollama
 from langchain_core.prompts import ChatPromptTemplate
+import json
 import os
+import sys
+import threading
+
+import catalog
+import embedding_service
+import index_store
+import retrieval_filters
+from extractive_debate import generate_extractive_debate
+
+# Printed right before the debate text when streaming, so callers can skip
+# the progress output that precedes it
+STREAM_MARKER = "<<<DEBATE>>>"
+
+# Chunks retrieved per mode: the LLM prompt stays small, the extractive
+# engine needs a wider pool of sentences to rank
+LLM_TOP_K = 1
+EXTRACTIVE_TOP_K = 4
+
+MODES = ("llm", "extractive")
+
+# Exit status of the CLI when the debate could not be generated, and when
+# an LLM debate fell back to an extractive one (the debate is still printed)
+EXIT_ERROR = 1
+EXIT_FALLBACK = 3
+
+
+class DebateError(Exception):
+    """A debate could not be generated (no index, nothing relevant found, ...)"""
 
 # DEBATE PROMPT TEMPLATE
 DEBATE_TEMPLATE = """
@@ -32,36 +60,57 @@ RULES:
 3. Be objective and academic
 """
 
-def generate_debate(query_text, chroma_path="chroma_db"):
-    """Generate a structured debate using local LLM"""
+def generate_debate(query_text, chroma_path="chroma_db", on_token=None, mode="llm", filters=None):
+    """Generate a structured debate using local LLM
+    
+    If on_token is given, the response is streamed and every generated
+    chunk is passed to it as soon as it arrives. mode="extractive" skips the
+    LLM and assembles the debate from ranked document sentences instead.
+    filters (see retrieval_filters) restricts which chunks are searched.
+    Errors are returned as the debate text; see run_generation() to tell
+    them (and fallbacks) apart.
+    """
+    try:
+        return run_generation(query_text, chroma_path, on_token, mode, filters)[0]
+    except DebateError as e:
+        return f" {e}"
+
+def run_generation(query_text, chroma_path="chroma_db", on_token=None, mode="llm", filters=None):
+    """
+    Generate a debate, reporting how it was produced
+    
+    Same arguments as generate_debate().
+    
+    Returns:
+        Tuple of (debate text, fallback), where fallback is True if an LLM
+        debate was requested but Ollama was unavailable and the debate was
+        assembled from the documents instead
     
-    # Check if database exists
-    if not os.path.exists(chroma_path):
-        return f" Error: Database not found at {chroma_path}\nPlease run 'python create_database.py' first to create the database."
+    Raises:
+        DebateError: If no debate could be generated
+    """
+    # Pin the current index version so a concurrent rebuild cannot change
+    # or delete it while we read
+    lease = _pin(chroma_path)
     
     try:
         # 1. Load local embeddings and database
         print("Loading local embeddings model...")
-        embeddings = HuggingFaceEmbeddings(
-            model_name="all-MiniLM-L6-v2",
-            model_kwargs={'device': 'cpu'}
-        )
+        embeddings = embedding_service.get_embeddings()
         
         print("Loading vector database...")
-        db = Chroma(
-            persist_directory=chroma_path,
-            embedding_function=embeddings
-        )
+        db = open_snapshot(lease.path, embeddings)
         
         # 2. Search for relevant context
         print(f"Searching for relevant documents about: {query_text}")
-        results = db.similarity_search_with_relevance_scores(query_text, k=1)  # Reduced from 2 to 1 for faster response
-        
-        if not results or len(results) == 0:
-            return f" No relevant documents found for the topic: {query_text}\n\nTry:\n1. Adding more PDFs to the 'data' folder\n2. Running 'python create_database.py' again\n3. Using different search terms"
+        top_k = EXTRACTIVE_TOP_K if mode == "extractive" else LLM_TOP_K
+        results = retrieve(db, lease.path, embeddings, query_text, top_k, filters)
         
         print(f"Found {len(results)} relevant documents")
         
+        if mode == "extractive":
+            return _emit(generate_extractive_debate(query_text, results, embeddings), on_token), False
+        
         # 3. Format context with citations (limit content length)
         context_parts = []
         for i, (doc, score) in enumerate(results):
@@ -97,6 +146,7 @@ def generate_debate(query_text, chroma_path="chroma_db"):
         print("Loading local LLM (this may take a moment)...")
         try:
             llm = Ollama(
+                base_url=os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434"),
                 model="mistral",  # or "llama2", "mixtral", "neural-chat"
                 temperature=0.2,  # Reduced temperature for faster, more focused responses
                 num_predict=256   # Reduced response length for faster generation
@@ -105,56 +155,153 @@ def generate_debate(query_text, chroma_path="chroma_db"):
             # Fallback to a simple template-based response
             print(f"Ollama not available: {e}")
             print("Generating fallback response...")
-            return generate_fallback_debate(query_text, results)
+            return _emit(generate_fallback_debate(query_text, results, embeddings), on_token), True
         
         # 6. Get response
         print("Generating debate response...")
-        response = llm.invoke(prompt)
-        return response
+        chunks = []
+        try:
+            if on_token is None:
+                return llm.invoke(prompt), False
+            
+            for chunk in llm.stream(prompt):
+                chunks.append(chunk)
+                on_token(chunk)
+        except Exception as e:
+            # Ollama only connects on first use; fall back if it is not running
+            if chunks:
+                raise
+            print(f"Ollama not available: {e}")
+            print("Generating fallback response...")
+            return _emit(generate_fallback_debate(query_text, results, embeddings), on_token), True
+        return "".join(chunks), False
         
+    except DebateError:
+        raise
     except Exception as e:
-        return f" Error generating debate: {e}"
+        raise DebateError(f"Error generating debate: {e}")
+    finally:
+        lease.release()
 
-def generate_fallback_debate(query_text, results):
-    """Generate a simple fallback debate when Ollama is not available"""
+def extractive_debate(query_text, chroma_path="chroma_db", filters=None, embeddings=None):
+    """
+    Extractive debate for callers that stay loaded (the API server)
     
-    # Extract key information from results
-    context_summary = []
-    for i, (doc, score) in enumerate(results):
-        source = doc.metadata.get("source", "Unknown")
-        page = doc.metadata.get("page", 1)
-        # Take first 200 characters as summary
-        content_preview = doc.page_content[:200].replace('\n', ' ')
-        context_summary.append(f"Document {i+1}: {source} (Page {page}) - {content_preview}...")
+    Runs in the caller's process with its embeddings model and a cached
+    Chroma handle per snapshot, so it costs one query embedding, one search
+    and one sentence-ranking batch instead of a new process and model load.
     
-    # Create a simple structured response
-    response = f"""
-PERSPECTIVE A: [Analysis based on available documents]
-- Key finding from documents: {context_summary[0] if len(context_summary) > 0 else 'Document analysis pending'}
-- Supporting evidence: {context_summary[1] if len(context_summary) > 1 else 'Additional evidence needed'}
+    Raises:
+        DebateError: If there is no index or nothing relevant was found
+    """
+    embeddings = embeddings or embedding_service.get_embeddings()
+    lease = _pin(chroma_path)
+    try:
+        db = open_snapshot(lease.path, embeddings)
+        results = retrieve(db, lease.path, embeddings, query_text, EXTRACTIVE_TOP_K, filters)
+        return generate_extractive_debate(query_text, results, embeddings)
+    finally:
+        lease.release()
 
-PERSPECTIVE B: [Alternative interpretation]
-- Different perspective: The documents suggest multiple interpretations
-- Counter-evidence: {context_summary[2] if len(context_summary) > 2 else 'Further analysis required'}
+def _pin(chroma_path):
+    lease = index_store.pin(chroma_path)
+    if lease is None:
+        raise DebateError(f"Error: Database not found at {chroma_path}\nPlease run 'python create_database.py' first to create the database.")
+    return lease
 
-NEUTRAL SUMMARY: Based on the available documents, the topic '{query_text}' appears to be related to the content found in the uploaded PDFs. For a more comprehensive analysis, please ensure Ollama is properly installed and configured with a suitable model.
+_open_dbs = {}
+_open_dbs_lock = threading.Lock()
 
-NOTE: This is a simplified response. For full debate generation, please install Ollama with a local LLM model.
-"""
+def open_snapshot(snapshot_path, embeddings):
+    """Chroma store of a pinned snapshot, cached per process"""
+    with _open_dbs_lock:
+        db = _open_dbs.get(snapshot_path)
+        if db is None or db.embeddings is not embeddings:
+            db = Chroma(
+                persist_directory=snapshot_path,
+                embedding_function=embeddings
+            )
+            # Snapshots never change, so entries only need evicting for memory
+            if len(_open_dbs) >= 4:
+                _open_dbs.pop(next(iter(_open_dbs)))
+            _open_dbs[snapshot_path] = db
+        return db
+
+def retrieve(db, snapshot_path, embeddings, query_text, k, filters=None):
+    """
+    Top-k (Document, relevance) pairs for a query, honouring filters
     
+    Raises:
+        DebateError: If nothing relevant was found
+    """
+    filters = retrieval_filters.parse_filters(filters)
+    if filters:
+        results = search_filtered(db, snapshot_path, embeddings, query_text, k, filters)
+    else:
+        results = db.similarity_search_with_relevance_scores(query_text, k=k)
+    
+    if not results:
+        raise DebateError(f"No relevant documents found for the topic: {query_text}\n\nTry:\n1. Adding more PDFs to the 'data' folder\n2. Running 'python create_database.py' again\n3. Using different search terms")
+    return results
+
+def search_filtered(db, snapshot_path, embeddings, query_text, k, filters):
+    """Search only the chunks allowed by filters, using the snapshot's bitmaps"""
+    filter_index = retrieval_filters.load_filter_index(snapshot_path, db._collection)
+    notebook_sources = None
+    if "notebooks" in filters:
+        notebook_sources = catalog.DocumentCatalog().sources_for_notebooks(filters["notebooks"])
+    return filter_index.search(
+        db._collection, embeddings.embed_query(query_text), k, filters, notebook_sources
+    )
+
+def _emit(response, on_token):
+    """Pass a complete response to on_token (if streaming) and return it"""
+    if on_token:
+        on_token(response)
     return response
 
+def generate_fallback_debate(query_text, results, embeddings):
+    """Generate an extractive debate when Ollama is not available"""
+    response = generate_extractive_debate(query_text, results, embeddings)
+    return response + "\nFor full debate generation, please install Ollama with a local LLM model.\n"
+
 def main():
     parser = argparse.ArgumentParser(description="Generate academic debate from local documents")
     parser.add_argument("topic", type=str, help="Debate topic/question")
     parser.add_argument("--db", type=str, default="chroma_db", help="Path to Chroma database")
+    parser.add_argument("--stream", action="store_true", help="Stream the debate as it is generated")
+    parser.add_argument("--mode", choices=MODES, default="llm", help="'extractive' builds the debate without an LLM")
+    parser.add_argument("--filter", type=json.loads, default=None,
+                        help='JSON filter, e.g. \'{"source": ["Test.pdf"], "pages": [[1, 5]]}\'')
     args = parser.parse_args()
     
     print("="*60)
     print("LOCAL RAG DEBATE GENERATOR")
     print("="*60)
     
-    debate = generate_debate(args.topic, args.db)
+    if args.stream:
+        def emit(chunk):
+            if not emit.started:
+                print(STREAM_MARKER, flush=True)
+                emit.started = True
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+        emit.started = False
+        
+        try:
+            _, fallback = run_generation(args.topic, args.db, on_token=emit, mode=args.mode, filters=args.filter)
+        except DebateError as e:
+            # Streamed too, so the reader sees why the debate stopped
+            emit(f"\n {e}\n")
+            print(e, file=sys.stderr)
+            sys.exit(EXIT_ERROR)
+        sys.exit(EXIT_FALLBACK if fallback else 0)
+    
+    try:
+        debate, fallback = run_generation(args.topic, args.db, mode=args.mode, filters=args.filter)
+    except DebateError as e:
+        print(e, file=sys.stderr)
+        sys.exit(EXIT_ERROR)
     
     print("\n" + "="*60)
     print("ACADEMIC DEBATE GENERATION")
@@ -163,6 +310,9 @@ def main():
     print("="*60)
     print(debate)
     print("="*60)
+    if fallback:
+        print("Ollama was not available; this debate was assembled from the documents.", file=sys.stderr)
+        sys.exit(EXIT_FALLBACK)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
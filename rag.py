@@ -3,9 +3,12 @@ Minimal RAG Application - Core Logic
 Fast, clean, and optimized for performance with Google Gemini Flash
 """
 
+import asyncio
 import os
 import tempfile
-from typing import List, Optional
+import threading
+import time
+from typing import List, NamedTuple, Optional
 from pathlib import Path
 
 import pypdf
@@ -17,6 +20,52 @@ from langchain_core.prompts import PromptTemplate
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import RetrievalQA
 
+import catalog
+import dedup
+import index_store
+import retrieval_filters
+
+
+_shared_embeddings = None
+_shared_embeddings_lock = threading.Lock()
+
+
+def get_shared_embeddings() -> GoogleGenerativeAIEmbeddings:
+    """
+    Return the process-wide embedding client
+
+    All pipelines (and all concurrent queries/ingests) share one client so
+    they reuse its pooled connections instead of opening their own.
+    """
+    global _shared_embeddings
+    if _shared_embeddings is None:
+        with _shared_embeddings_lock:
+            if _shared_embeddings is None:
+                _shared_embeddings = GoogleGenerativeAIEmbeddings(
+                    model="models/embedding-001",
+                    google_api_key=os.getenv("GOOGLE_API_KEY")
+                )
+    return _shared_embeddings
+
+
+class IndexSnapshot(NamedTuple):
+    """Immutable view of the index that a query runs against"""
+    vectorstore: Optional[Chroma]
+    qa_chain: Optional[RetrievalQA]
+    version: Optional[str]
+
+
+EMPTY_SNAPSHOT = IndexSnapshot(vectorstore=None, qa_chain=None, version=None)
+
+
+class _NoLease:
+    """Stand-in lease for the empty snapshot"""
+    def release(self):
+        pass
+
+
+_NO_LEASE = _NoLease()
+
 
 class RAGPipeline:
     """High-performance RAG pipeline optimized for speed and accuracy"""
@@ -26,21 +75,21 @@ class RAGPipeline:
         Initialize RAG pipeline with Gemini Flash and ChromaDB
         
         Args:
-            persist_directory: Directory to store vector database
+            persist_directory: Root directory of the versioned vector database
         """
         self.persist_directory = persist_directory
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=os.getenv("GOOGLE_API_KEY")
-        )
+        self.embeddings = get_shared_embeddings()
         self.llm = ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             google_api_key=os.getenv("GOOGLE_API_KEY"),
             temperature=0.1,  # Low temperature for concise answers
             max_tokens=500    # Limit response length
         )
-        self.vectorstore = None
-        self.qa_chain = None
+        # Readers grab the current snapshot without locking; writers build the
+        # next one under the write lock and swap it in with a single assignment.
+        self._snapshot = EMPTY_SNAPSHOT
+        self._lease = None
+        self._write_lock = threading.Lock()
         
         # Initialize text splitter with optimized parameters
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -49,6 +98,16 @@ class RAGPipeline:
             separators=["\n\n", "\n", ". ", " ", ""]
         )
     
+    @property
+    def vectorstore(self) -> Optional[Chroma]:
+        """Vector store of the current snapshot"""
+        return self._snapshot.vectorstore
+    
+    @property
+    def qa_chain(self) -> Optional[RetrievalQA]:
+        """QA chain of the current snapshot"""
+        return self._snapshot.qa_chain
+    
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
         Extract and clean text from PDF file
@@ -88,12 +147,14 @@ class RAGPipeline:
             List of Document objects
         """
         documents = []
+        ingested_at = int(time.time())
         for i, (text, source) in enumerate(zip(texts, sources)):
             doc = Document(
                 page_content=text,
                 metadata={
                     "source": source,
-                    "chunk_id": i
+                    "chunk_id": i,
+                    "ingested_at": ingested_at
                 }
             )
             documents.append(doc)
@@ -125,24 +186,46 @@ class RAGPipeline:
             if not all_texts:
                 return False
             
-            # Create documents
-            documents = self.create_documents(all_texts, all_sources)
+            # Create documents, dropping repeated chunks before they are embedded
+            documents, stats = dedup.deduplicate(
+                self.create_documents(all_texts, all_sources)
+            )
+            print(f"Deduplicated chunks: {stats}")
             
-            # Initialize or update vectorstore
-            if self.vectorstore is None:
-                self.vectorstore = Chroma.from_documents(
-                    documents=documents,
-                    embedding=self.embeddings,
-                    persist_directory=self.persist_directory
+            # Only one writer at a time, across processes too; queries keep
+            # using the old snapshot
+            with self._write_lock, index_store.build_lock(self.persist_directory):
+                # Build the next version on a copy of the published index
+                base_version = index_store.current_version(self.persist_directory)
+                version, path = index_store.new_snapshot(
+                    self.persist_directory, base_version=base_version
+                )
+                try:
+                    vectorstore = Chroma(
+                        persist_directory=path,
+                        embedding_function=self.embeddings
+                    )
+                    documents = dedup.fold_indexed_duplicates(vectorstore, documents, path)
+                    if documents:
+                        vectorstore.add_documents(documents)
+                    
+                    # Persist changes
+                    vectorstore.persist()
+                    retrieval_filters.build_filter_index(vectorstore._collection, path)
+                    dedup.build_minhash_index(vectorstore._collection, path)
+                    qa_chain = self._build_qa_chain(vectorstore)
+                except Exception:
+                    index_store.discard(self.persist_directory, version)
+                    raise
+                
+                # Publish on disk, then swap the in-memory snapshot
+                # Held for as long as the snapshot is live, so keep it fresh
+                lease = index_store.Lease(self.persist_directory, version).keep_alive()
+                index_store.publish(self.persist_directory, version)
+                self._swap_snapshot(
+                    IndexSnapshot(vectorstore=vectorstore, qa_chain=qa_chain, version=version),
+                    lease
                 )
-            else:
-                self.vectorstore.add_documents(documents)
-            
-            # Persist changes
-            self.vectorstore.persist()
-            
-            # Reinitialize QA chain
-            self._setup_qa_chain()
             
             return True
             
@@ -150,8 +233,44 @@ class RAGPipeline:
             print(f"Error adding documents: {str(e)}")
             return False
     
-    def _setup_qa_chain(self):
-        """Setup the QA chain with optimized prompt"""
+    def _swap_snapshot(self, snapshot: IndexSnapshot, lease: Optional[index_store.Lease]):
+        """Make snapshot current and let go of the previous version (write lock held)"""
+        old_lease = self._lease
+        self._snapshot = snapshot
+        self._lease = lease
+        if old_lease is not None:
+            old_lease.release()
+        index_store.collect_garbage(self.persist_directory)
+    
+    def _pin_snapshot(self) -> tuple:
+        """
+        Current snapshot plus a lease on its version for the caller to release
+        
+        The lease keeps garbage collection from deleting the snapshot's
+        directory while a query that started before a swap is still reading it.
+        """
+        snapshot = self._snapshot
+        if snapshot.version is None:
+            return snapshot, _NO_LEASE
+        return snapshot, index_store.Lease(self.persist_directory, snapshot.version)
+    
+    async def aadd_documents(self, pdf_paths: List[str]) -> bool:
+        """
+        Async variant of add_documents
+        
+        Ingestion runs in a worker thread, so concurrent aquery calls keep
+        being served from the previous snapshot until the new one is swapped in.
+        
+        Args:
+            pdf_paths: List of PDF file paths
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        return await asyncio.to_thread(self.add_documents, pdf_paths)
+    
+    def _build_qa_chain(self, vectorstore: Chroma) -> RetrievalQA:
+        """Build a QA chain with optimized prompt over the given vector store"""
         # Optimized prompt for concise, structured answers
         prompt_template = """Use the following pieces of context to answer the question at the end. 
 If you don't know the answer, just say that you don't know, don't try to make up an answer.
@@ -169,10 +288,10 @@ Answer:"""
             input_variables=["context", "question"]
         )
         
-        self.qa_chain = RetrievalQA.from_chain_type(
+        return RetrievalQA.from_chain_type(
             llm=self.llm,
             chain_type="stuff",
-            retriever=self.vectorstore.as_retriever(
+            retriever=vectorstore.as_retriever(
                 search_kwargs={"k": 4}  # Top-K = 4 as specified
             ),
             chain_type_kwargs={
@@ -182,59 +301,128 @@ Answer:"""
             return_source_documents=True
         )
     
-    def query(self, question: str) -> dict:
+    def query(self, question: str, filters: Optional[dict] = None) -> dict:
         """
         Query the RAG system with a question
         
         Args:
             question: User question
+            filters: Optional metadata filter (see retrieval_filters)
             
         Returns:
             Dictionary with answer and source information
         """
-        if self.qa_chain is None:
-            return {
-                "answer": "No documents have been uploaded yet. Please upload PDF files first.",
-                "sources": []
-            }
+        snapshot, lease = self._pin_snapshot()
+        if snapshot.qa_chain is None:
+            return self._no_documents_response()
         
         try:
-            # Get response from QA chain
-            response = self.qa_chain({"query": question})
-            
-            # Extract answer and sources
-            answer = response["result"]
-            source_docs = response["source_documents"]
-            
-            # Extract source information
-            sources = []
-            for doc in source_docs:
-                metadata = doc.metadata
-                sources.append({
-                    "filename": metadata.get("source", "Unknown"),
-                    "chunk_id": metadata.get("chunk_id", 0),
-                    "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
-                })
+            filters = retrieval_filters.parse_filters(filters)
+            if filters:
+                docs = self._retrieve_filtered(snapshot, question, filters)
+                output = snapshot.qa_chain.combine_documents_chain.invoke(
+                    {"input_documents": docs, "question": question}
+                )
+                response = {"result": output["output_text"], "source_documents": docs}
+            else:
+                # Get response from QA chain
+                response = snapshot.qa_chain({"query": question})
+            return self._format_response(response)
             
+        except Exception as e:
             return {
-                "answer": answer,
-                "sources": sources
+                "answer": f"Error processing query: {str(e)}",
+                "sources": []
             }
+        finally:
+            lease.release()
+    
+    async def aquery(self, question: str, filters: Optional[dict] = None) -> dict:
+        """
+        Async variant of query, safe to run concurrently with aadd_documents
+        
+        Args:
+            question: User question
+            filters: Optional metadata filter (see retrieval_filters)
+            
+        Returns:
+            Dictionary with answer and source information
+        """
+        snapshot, lease = self._pin_snapshot()
+        if snapshot.qa_chain is None:
+            return self._no_documents_response()
+        
+        try:
+            filters = retrieval_filters.parse_filters(filters)
+            if filters:
+                docs = await asyncio.to_thread(self._retrieve_filtered, snapshot, question, filters)
+                output = await snapshot.qa_chain.combine_documents_chain.ainvoke(
+                    {"input_documents": docs, "question": question}
+                )
+                response = {"result": output["output_text"], "source_documents": docs}
+            else:
+                response = await snapshot.qa_chain.ainvoke({"query": question})
+            return self._format_response(response)
             
         except Exception as e:
             return {
                 "answer": f"Error processing query: {str(e)}",
                 "sources": []
             }
+        finally:
+            lease.release()
+    
+    def _retrieve_filtered(self, snapshot: IndexSnapshot, question: str, filters: dict) -> List[Document]:
+        """Top-4 chunks among those allowed by filters, using the snapshot's bitmaps"""
+        collection = snapshot.vectorstore._collection
+        filter_index = retrieval_filters.load_filter_index(
+            index_store.version_path(self.persist_directory, snapshot.version), collection
+        )
+        notebook_sources = None
+        if "notebooks" in filters:
+            notebook_sources = catalog.DocumentCatalog().sources_for_notebooks(filters["notebooks"])
+        results = filter_index.search(
+            collection, self.embeddings.embed_query(question), 4, filters, notebook_sources
+        )
+        return [doc for doc, _ in results]
+    
+    @staticmethod
+    def _no_documents_response() -> dict:
+        return {
+            "answer": "No documents have been uploaded yet. Please upload PDF files first.",
+            "sources": []
+        }
+    
+    @staticmethod
+    def _format_response(response: dict) -> dict:
+        """Extract answer and sources from a QA chain response"""
+        answer = response["result"]
+        source_docs = response["source_documents"]
+        
+        # Extract source information
+        sources = []
+        for doc in source_docs:
+            metadata = doc.metadata
+            sources.append({
+                "filename": metadata.get("source", "Unknown"),
+                "chunk_id": metadata.get("chunk_id", 0),
+                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content
+            })
+        
+        return {
+            "answer": answer,
+            "sources": sources
+        }
     
     def list_documents(self) -> List[str]:
         """List all documents in the vector database"""
-        if self.vectorstore is None:
+        vectorstore = self._snapshot.vectorstore
+        if vectorstore is None:
             return []
         
         try:
             # Get all documents
-            docs = self.vectorstore.get()
+            docs = vectorstore.get()
             sources = set()
             
             for doc in docs["metadatas"]:
@@ -249,16 +437,11 @@ Answer:"""
     def clear_database(self):
         """Clear all documents from the vector database"""
         try:
-            if self.vectorstore:
-                # Clear all documents
-                self.vectorstore.delete_collection()
-                self.vectorstore = None
-                self.qa_chain = None
-            
-            # Remove persist directory if it exists
-            if os.path.exists(self.persist_directory):
-                import shutil
-                shutil.rmtree(self.persist_directory)
+            with self._write_lock, index_store.build_lock(self.persist_directory):
+                # Unpublish rather than delete: readers still holding the
+                # previous version keep working until they finish
+                index_store.publish(self.persist_directory, None)
+                self._swap_snapshot(EMPTY_SNAPSHOT, None)
                 
         except Exception as e:
             print(f"Error clearing database: {str(e)}")
@@ -0,0 +1,289 @@
+"""
+Metadata-filtered retrieval over precomputed bitmaps
+
+When an index version is built, a companion file (filter_index_v2.npz) is
+written next to the Chroma files with:
+
+    ids          chunk ids, in row order
+    vectors      normalized chunk embeddings
+    pages        page number per chunk (-1 if unknown)
+    extra_rows   rows of chunks that also stand for other pages...
+    extra_pages  ...and those pages (merged duplicates, see dedup)
+    ingested     ingest time per chunk, epoch seconds (NaN if unknown)
+    sources      source file names
+    bitmaps      one packed bitmap per source marking its chunks
+
+A deduplicated chunk is marked in the bitmap of every source it was found
+in and matches every page it was found on, so filtering on a re-uploaded
+or overlapping copy still finds the canonical chunk.
+
+A filter is resolved to a row mask by OR-ing the bitmaps of the allowed
+sources (notebooks resolve to their sources through the catalog) and
+AND-ing page and date ranges. Only the rows left in the mask are scored,
+so a narrow filter never competes with unrelated chunks for the top k.
+
+Filter expressions (as accepted by /api/generate and query_debate.py):
+
+    {
+        "source": ["Test.pdf"],            # or a single name
+        "notebook": ["main"],              # or a single id
+        "pages": [[1, 5], 9],              # ranges (inclusive) or single pages
+        "ingestedAfter": "2026-01-01",     # ISO date/time or epoch seconds
+        "ingestedBefore": "2026-02-01T12:00:00Z"
+    }
+
+Page numbers are matched against the chunk's page metadata, i.e. the same
+numbers that appear in citations.
+"""
+
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain_core.documents import Document
+
+import dedup
+
+# Versioned so indexes written before merged provenance was indexed are
+# rebuilt on first use
+FILTER_INDEX_NAME = "filter_index_v2.npz"
+
+FILTER_KEYS = ("source", "notebook", "pages", "ingestedAfter", "ingestedBefore")
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _names(value, key):
+    """A name or list of names, as strings"""
+    names = _as_list(value)
+    if not all(isinstance(name, str) for name in names):
+        raise ValueError(f"'{key}' must be a name or a list of names")
+    return names
+
+
+def _page(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise TypeError(f"not a page number: {value!r}")
+    return int(value)
+
+
+def _parse_time(value):
+    if isinstance(value, bool):
+        raise ValueError(f"not a date: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def parse_filters(raw):
+    """
+    Validate and normalize a filter expression
+
+    Args:
+        raw: Filter dict as described in the module docstring, or None
+
+    Returns:
+        Normalized filter dict, or None if nothing is filtered
+
+    Raises:
+        ValueError: If the expression is malformed
+    """
+    if not raw:
+        return None
+    if not isinstance(raw, dict):
+        raise ValueError("Filters must be an object")
+    unknown = set(raw) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {', '.join(sorted(unknown))}")
+
+    filters = {}
+    if raw.get("source"):
+        filters["sources"] = _names(raw["source"], "source")
+    if raw.get("notebook"):
+        filters["notebooks"] = _names(raw["notebook"], "notebook")
+    if raw.get("pages"):
+        ranges = []
+        for item in _as_list(raw["pages"]):
+            try:
+                if isinstance(item, (list, tuple)) and len(item) == 2:
+                    ranges.append((_page(item[0]), _page(item[1])))
+                else:
+                    page = _page(item)
+                    ranges.append((page, page))
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid page range: {item!r}")
+        filters["pages"] = ranges
+    try:
+        if raw.get("ingestedAfter") is not None:
+            filters["ingested_after"] = _parse_time(raw["ingestedAfter"])
+        if raw.get("ingestedBefore") is not None:
+            filters["ingested_before"] = _parse_time(raw["ingestedBefore"])
+    except ValueError:
+        raise ValueError("Ingest dates must be ISO dates or epoch seconds")
+    return filters or None
+
+
+def build_filter_index(collection, path):
+    """
+    Precompute the filter index of a freshly built Chroma collection
+
+    Args:
+        collection: Chroma collection (vectordb._collection)
+        path: Snapshot directory to write the filter index into
+    """
+    data = collection.get(include=["embeddings", "metadatas"])
+    ids = list(data["ids"])
+    metadatas = data["metadatas"] or []
+
+    vectors = np.asarray(data["embeddings"] if ids else np.zeros((0, 0)), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    pages = np.array([int(m.get("page", -1)) for m in metadatas], dtype=np.int32)
+    ingested = np.array([float(m.get("ingested_at", np.nan)) for m in metadatas], dtype=np.float64)
+
+    chunk_sources = [
+        {m.get("source", "Unknown"), *dedup._split(m.get("sources"))} for m in metadatas
+    ]
+    extra_rows = []
+    extra_pages = []
+    for row, metadata in enumerate(metadatas):
+        for page_ref in dedup._split(metadata.get("pages")):
+            page = int(page_ref.rsplit(":", 1)[-1])
+            if page != pages[row]:
+                extra_rows.append(row)
+                extra_pages.append(page)
+
+    sources = sorted(set().union(*chunk_sources))
+    row_of = {source: i for i, source in enumerate(sources)}
+    bitmaps = np.zeros((len(sources), len(ids)), dtype=bool)
+    for row, names in enumerate(chunk_sources):
+        for name in names:
+            bitmaps[row_of[name], row] = True
+
+    tmp_path = os.path.join(path, FILTER_INDEX_NAME + ".tmp.npz")
+    np.savez(
+        tmp_path,
+        ids=np.array(ids, dtype=str),
+        vectors=vectors,
+        pages=pages,
+        extra_rows=np.array(extra_rows, dtype=np.int64),
+        extra_pages=np.array(extra_pages, dtype=np.int32),
+        ingested=ingested,
+        sources=np.array(sources, dtype=str),
+        bitmaps=np.packbits(bitmaps, axis=1),
+    )
+    os.replace(tmp_path, os.path.join(path, FILTER_INDEX_NAME))
+
+
+class FilterIndex:
+    """Loaded filter index of one snapshot"""
+
+    def __init__(self, path):
+        with np.load(os.path.join(path, FILTER_INDEX_NAME)) as data:
+            self.ids = data["ids"]
+            self.vectors = data["vectors"]
+            self.pages = data["pages"]
+            self.extra_rows = data["extra_rows"]
+            self.extra_pages = data["extra_pages"]
+            self.ingested = data["ingested"]
+            self.sources = {str(s): i for i, s in enumerate(data["sources"])}
+            self.bitmaps = data["bitmaps"]
+
+    def _source_mask(self, sources):
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for source in sources:
+            row = self.sources.get(source)
+            if row is not None:
+                mask |= np.unpackbits(self.bitmaps[row], count=len(self.ids)).astype(bool)
+        return mask
+
+    def mask(self, filters, notebook_sources=None):
+        """
+        Rows allowed by a normalized filter
+
+        Args:
+            filters: Output of parse_filters()
+            notebook_sources: Source names belonging to the filtered notebooks
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        if "sources" in filters:
+            mask &= self._source_mask(filters["sources"])
+        if "notebooks" in filters:
+            mask &= self._source_mask(notebook_sources or [])
+        if "pages" in filters:
+            in_range = np.zeros(len(self.ids), dtype=bool)
+            for low, high in filters["pages"]:
+                in_range |= (self.pages >= low) & (self.pages <= high)
+                extra = (self.extra_pages >= low) & (self.extra_pages <= high)
+                in_range[self.extra_rows[extra]] = True
+            mask &= in_range
+        # Comparisons with NaN are False, so undated chunks are excluded
+        if "ingested_after" in filters:
+            mask &= self.ingested >= filters["ingested_after"]
+        if "ingested_before" in filters:
+            mask &= self.ingested <= filters["ingested_before"]
+        return mask
+
+    def search(self, collection, query_vector, k, filters, notebook_sources=None):
+        """
+        Top-k chunks among the rows allowed by filters
+
+        Returns:
+            List of (Document, cosine similarity) pairs, best first
+        """
+        rows = np.flatnonzero(self.mask(filters, notebook_sources))
+        if len(rows) == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = self.vectors[rows] @ query
+        if len(rows) > k:
+            best = np.argpartition(-scores, k)[:k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-scores[best])]
+
+        ids = [str(self.ids[rows[i]]) for i in best]
+        fetched = collection.get(ids=ids, include=["documents", "metadatas"])
+        by_id = {
+            doc_id: Document(page_content=text, metadata=metadata)
+            for doc_id, text, metadata in zip(fetched["ids"], fetched["documents"], fetched["metadatas"])
+        }
+        return [(by_id[doc_id], float(scores[i])) for doc_id, i in zip(ids, best) if doc_id in by_id]
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def load_filter_index(path, collection=None):
+    """
+    Filter index of a snapshot, cached per process
+
+    Snapshots built before filter indexes existed get one built on first
+    use when the collection is given.
+    """
+    with _loaded_lock:
+        index = _loaded.get(path)
+        if index is None:
+            if not os.path.exists(os.path.join(path, FILTER_INDEX_NAME)):
+                if collection is None:
+                    raise FileNotFoundError(f"No filter index in {path}")
+                build_filter_index(collection, path)
+            index = FilterIndex(path)
+            # Snapshots never change, so entries only need evicting for memory
+            if len(_loaded) >= 4:
+                _loaded.pop(next(iter(_loaded)))
+            _loaded[path] = index
+        return index
@@ -0,0 +1,156 @@
+"""
+Single-flight request coalescing
+
+Concurrent callers asking for the same key attach to one in-progress call
+instead of each starting their own. Nothing is cached: once a call finishes
+its key is released and the next request starts a fresh one.
+"""
+
+import threading
+
+
+class _Call:
+    """State of one in-flight call shared by its leader and followers"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.chunks = []
+        self.finished = False
+        self.result = None
+        self.error = None
+        self.waiters = 1
+
+    def append(self, chunk):
+        with self.condition:
+            self.chunks.append(chunk)
+            self.condition.notify_all()
+
+    def finish(self, result=None, error=None):
+        with self.condition:
+            self.result = result
+            self.error = error
+            self.finished = True
+            self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while not self.finished:
+                self.condition.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def follow(self):
+        """Yield every chunk from the start, then live chunks until finished"""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    self.condition.wait()
+                pending = self.chunks[index:]
+                index += len(pending)
+                finished = self.finished and index >= len(self.chunks)
+            for chunk in pending:
+                yield chunk
+            if finished:
+                break
+        if self.error is not None:
+            raise self.error
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def _join(self, key):
+        """Return (call, is_leader) for key, registering a new call if needed"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            return call, True
+
+    def _release(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers with the same key
+
+        Args:
+            key: Hashable identity of the call
+            fn: Zero-argument callable producing the result
+
+        Returns:
+            Tuple of (result, shared) where shared is True when the result
+            came from a call started by another request
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return call.wait(), True
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._release(key, call)
+            call.finish(error=e)
+            raise
+        self._release(key, call)
+        call.finish(result=result)
+        return result, call.waiters > 1
+
+    def stream(self, key, producer):
+        """
+        Share one chunk stream between all concurrent callers with the same key
+
+        The producer runs in a background thread so that followers keep
+        receiving chunks even if the request that started it disconnects.
+        Late joiners first replay the chunks produced so far.
+
+        Args:
+            key: Hashable identity of the call
+            producer: Zero-argument callable returning an iterable of chunks
+
+        Returns:
+            Iterator over the chunks
+        """
+        call, leader = self._join(key)
+        if leader:
+            def run():
+                try:
+                    for chunk in producer():
+                        call.append(chunk)
+                except Exception as e:
+                    self._release(key, call)
+                    call.finish(error=e)
+                    return
+                self._release(key, call)
+                call.finish()
+
+            threading.Thread(target=run, daemon=True).start()
+        return call.follow()
+
+    def running(self, key):
+        """True if a call for key is in flight (a new caller would join it)"""
+        with self._lock:
+            return key in self._calls
+
+    def in_flight(self, matches=None):
+        """
+        Number of distinct calls currently running
+
+        Args:
+            matches: Optional predicate on the key; only matching calls count
+        """
+        with self._lock:
+            if matches is None:
+                return len(self._calls)
+            return sum(1 for key in self._calls if matches(key))
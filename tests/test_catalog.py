@@ -0,0 +1,32 @@
+import catalog
+
+
+def make_catalog(tmp_path):
+    return catalog.DocumentCatalog(str(tmp_path / "catalog.sqlite3"))
+
+
+def test_reindexing_keeps_first_ingest_time(tmp_path):
+    documents = make_catalog(tmp_path)
+    documents.register_upload("a.pdf", 10, content_hash="h1")
+    assert documents.first_ingested("a.pdf", "h1") is None
+
+    documents.mark_indexed("a.pdf", 10, 1, 3, "h1", ingested_at=1000)
+    documents.register_upload("a.pdf", 10, content_hash="h1")
+    documents.mark_indexed("a.pdf", 10, 1, 3, "h1", ingested_at=5000)
+
+    assert documents.first_ingested("a.pdf", "h1") == 1000
+
+
+def test_changed_content_is_ingested_anew(tmp_path):
+    documents = make_catalog(tmp_path)
+    documents.register_upload("a.pdf", 10, content_hash="h1")
+    documents.mark_indexed("a.pdf", 10, 1, 3, "h1", ingested_at=1000)
+
+    documents.register_upload("a.pdf", 12, content_hash="h2")
+    assert documents.first_ingested("a.pdf", "h2") is None
+    documents.mark_indexed("a.pdf", 12, 1, 3, "h2", ingested_at=7000)
+
+    assert documents.first_ingested("a.pdf", "h2") == 7000
+    # Replaced by hand in data/, without an upload
+    documents.mark_indexed("a.pdf", 14, 1, 3, "h3", ingested_at=8000)
+    assert documents.first_ingested("a.pdf", "h3") == 8000
@@ -0,0 +1,180 @@
+from langchain_core.documents import Document
+
+import dedup
+
+TEXT = (
+    "The industrial revolution transformed manufacturing across Europe and "
+    "reshaped labour markets, cities and trade for more than a century after "
+    "the first mechanized textile mills opened in northern England."
+)
+
+LONG_TEXT = " ".join([TEXT] * 4) + (
+    " Historians still debate whether living standards rose or fell for the "
+    "workers who moved from farms into the new factory towns."
+)
+
+
+def doc(text, source, page):
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+
+def test_exact_duplicates_merge_provenance():
+    kept, stats = dedup.deduplicate([
+        doc(TEXT, "a.pdf", 1),
+        doc("  " + TEXT.upper(), "b.pdf", 4),
+    ])
+
+    assert stats["exact_duplicates"] == 1
+    assert len(kept) == 1
+    metadata = kept[0].metadata
+    assert metadata["source"] == "a.pdf"
+    assert metadata["sources"] == "a.pdf;b.pdf"
+    assert metadata["pages"] == "a.pdf:1;b.pdf:4"
+    assert metadata["duplicate_count"] == 1
+    assert metadata["content_hash"] == dedup.content_hash(TEXT)
+
+
+def test_near_duplicates_merge():
+    # Same passage with the chunk boundary shifted by a couple of words
+    shifted = " ".join(LONG_TEXT.split()[2:]) + " in the end"
+    kept, stats = dedup.deduplicate([doc(LONG_TEXT, "a.pdf", 1), doc(shifted, "pack.pdf", 9)])
+
+    assert stats["near_duplicates"] == 1
+    assert kept[0].metadata["sources"] == "a.pdf;pack.pdf"
+
+
+def test_distinct_chunks_are_kept():
+    other = "Photosynthesis converts light energy into chemical energy stored in glucose molecules."
+    kept, stats = dedup.deduplicate([doc(TEXT, "a.pdf", 1), doc(other, "a.pdf", 2)])
+
+    assert len(kept) == 2
+    assert stats["exact_duplicates"] == stats["near_duplicates"] == 0
+
+
+def test_merge_metadata_accumulates_merged_chunks():
+    canonical = {"source": "a.pdf", "page": 1}
+    dedup.merge_metadata(canonical, {"source": "b.pdf", "page": 2})
+    dedup.merge_metadata(canonical, {
+        "source": "c.pdf", "page": 3,
+        "sources": "c.pdf;d.pdf", "pages": "c.pdf:3;d.pdf:5", "duplicate_count": 1,
+    })
+
+    assert canonical["sources"] == "a.pdf;b.pdf;c.pdf;d.pdf"
+    assert canonical["pages"] == "a.pdf:1;b.pdf:2;c.pdf:3;d.pdf:5"
+    assert canonical["duplicate_count"] == 3
+
+
+class FakeStore:
+    """The slice of the Chroma API fold_indexed_duplicates uses"""
+
+    def __init__(self, metadatas, documents=None):
+        self.metadatas = metadatas
+        self.documents = documents or {}
+        self.queries = []
+        self._collection = self
+
+    def get(self, where=None, include=None, ids=None):
+        self.queries.append(where or ids)
+        if ids is None and where is not None:
+            hashes = where["content_hash"]["$in"]
+            ids = [i for i, m in self.metadatas.items() if m.get("content_hash") in hashes]
+        elif ids is None:
+            ids = list(self.metadatas)
+        ids = [i for i in ids if i in self.metadatas]
+        return {
+            "ids": ids,
+            "metadatas": [dict(self.metadatas[i]) for i in ids],
+            "documents": [self.documents.get(i) for i in ids],
+        }
+
+    def update(self, ids, metadatas):
+        self.metadatas.update(zip(ids, metadatas))
+
+
+def test_fold_indexed_duplicates_merges_into_existing_chunk():
+    store = FakeStore({"x": {"source": "a.pdf", "page": 1, "content_hash": dedup.content_hash(TEXT)}})
+    other = "Central banks raise interest rates to bring inflation under control over time."
+    documents, _ = dedup.deduplicate([doc(TEXT, "b.pdf", 2), doc(other, "b.pdf", 3)])
+
+    remaining = dedup.fold_indexed_duplicates(store, documents)
+
+    assert [d.page_content for d in remaining] == [other]
+    assert store.metadatas["x"]["sources"] == "a.pdf;b.pdf"
+    assert store.metadatas["x"]["pages"] == "a.pdf:1;b.pdf:2"
+
+
+def test_fold_indexed_duplicates_batches_hash_lookups(monkeypatch):
+    monkeypatch.setattr(dedup, "QUERY_BATCH_SIZE", 2)
+    store = FakeStore({})
+    documents = [doc(f"chunk number {i} of a long document", "a.pdf", i) for i in range(5)]
+    documents, _ = dedup.deduplicate(documents)
+
+    assert dedup.fold_indexed_duplicates(store, documents) == documents
+    assert [len(q["content_hash"]["$in"]) for q in store.queries] == [2, 2, 1]
+
+
+def test_fold_indexed_duplicates_finds_near_duplicates_in_snapshot(tmp_path):
+    store = FakeStore(
+        {"x": {"source": "a.pdf", "page": 1, "content_hash": dedup.content_hash(LONG_TEXT)}},
+        {"x": LONG_TEXT},
+    )
+    dedup.build_minhash_index(store, str(tmp_path))
+    shifted = " ".join(LONG_TEXT.split()[2:]) + " in the end"
+    documents, _ = dedup.deduplicate([doc(shifted, "pack.pdf", 9)])
+
+    assert dedup.fold_indexed_duplicates(store, documents) == documents
+    assert dedup.fold_indexed_duplicates(store, documents, str(tmp_path)) == []
+    assert store.metadatas["x"]["sources"] == "a.pdf;pack.pdf"
+    assert store.metadatas["x"]["pages"] == "a.pdf:1;pack.pdf:9"
+
+
+def test_minhash_index_reuses_and_drops_signatures(tmp_path, monkeypatch):
+    store = FakeStore({"x": {"source": "a.pdf"}}, {"x": TEXT})
+    dedup.build_minhash_index(store, str(tmp_path))
+
+    hashed = []
+    signature = dedup.minhash_signature
+    monkeypatch.setattr(dedup, "minhash_signature", lambda text: hashed.append(text) or signature(text))
+    del store.metadatas["x"]
+    store.metadatas["y"] = {"source": "b.pdf"}
+    store.documents["y"] = LONG_TEXT
+    dedup.build_minhash_index(store, str(tmp_path))
+
+    assert hashed == [LONG_TEXT]
+    index = dedup.load_minhash_index(str(tmp_path))
+    assert index.ids.tolist() == ["y"]
+    assert index.find(signature(LONG_TEXT)) == "y"
+
+
+def test_remove_sources_promotes_next_occurrence():
+    metadata = {
+        "source": "a.pdf", "page": 1,
+        "sources": "a.pdf;b.pdf", "pages": "a.pdf:1;b.pdf:4;a.pdf:7", "duplicate_count": 2,
+    }
+
+    remaining = dedup.remove_sources(metadata, {"a.pdf"})
+
+    assert remaining["source"] == "b.pdf"
+    assert remaining["page"] == 4
+    assert remaining["sources"] == "b.pdf"
+    assert remaining["pages"] == "b.pdf:4"
+    assert remaining["duplicate_count"] == 0
+    assert metadata["source"] == "a.pdf"
+
+
+def test_remove_sources_drops_chunks_only_in_removed_files():
+    assert dedup.remove_sources({"source": "a.pdf", "page": 1}, {"a.pdf"}) is None
+    assert dedup.remove_sources(
+        {"source": "a.pdf", "sources": "a.pdf;b.pdf", "pages": "a.pdf:1;b.pdf:2"},
+        {"a.pdf", "b.pdf"}
+    ) is None
+
+
+def test_remove_sources_keeps_other_chunks():
+    metadata = {"source": "b.pdf", "page": 2, "sources": "b.pdf;a.pdf", "pages": "b.pdf:2;a.pdf:1", "duplicate_count": 1}
+
+    remaining = dedup.remove_sources(metadata, {"a.pdf"})
+
+    assert (remaining["source"], remaining["page"]) == ("b.pdf", 2)
+    assert remaining["sources"] == "b.pdf"
+    assert remaining["duplicate_count"] == 0
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+
+import index_store
+
+
+def test_empty_root_has_no_index(tmp_path):
+    root = str(tmp_path)
+    assert index_store.current_version(root) is None
+    assert index_store.pin(root) is None
+
+
+def test_legacy_root_is_one_version(tmp_path):
+    (tmp_path / "chroma.sqlite3").write_bytes(b"")
+    root = str(tmp_path)
+    assert index_store.current_version(root) == index_store.LEGACY_VERSION
+    assert index_store.version_path(root, index_store.LEGACY_VERSION) == root
+
+
+def test_publish_flips_current_version(tmp_path):
+    root = str(tmp_path)
+    version, path = index_store.new_snapshot(root)
+    assert index_store.current_version(root) is None
+
+    index_store.publish(root, version)
+    assert index_store.current_version(root) == version
+    lease = index_store.pin(root)
+    assert lease.path == path
+    lease.release()
+
+
+def test_incremental_snapshot_copies_base(tmp_path):
+    root = str(tmp_path)
+    base, base_path = index_store.new_snapshot(root)
+    with open(os.path.join(base_path, "data.bin"), "w") as f:
+        f.write("v1")
+    index_store.publish(root, base)
+
+    version, path = index_store.new_snapshot(root, base_version=base)
+    with open(os.path.join(path, "data.bin")) as f:
+        assert f.read() == "v1"
+
+
+def _publish_versions(root, count):
+    versions = []
+    for _ in range(count):
+        version, _ = index_store.new_snapshot(root)
+        index_store.publish(root, version)
+        versions.append(version)
+    return versions
+
+
+def test_gc_keeps_current_and_recent_versions(tmp_path):
+    root = str(tmp_path)
+    versions = _publish_versions(root, 5)
+
+    removed = index_store.collect_garbage(root, keep=2)
+
+    assert removed == versions[:2]
+    for version in versions[2:]:
+        assert os.path.isdir(index_store.version_path(root, version))
+
+
+def test_gc_keeps_leased_versions(tmp_path):
+    root = str(tmp_path)
+    versions = _publish_versions(root, 1)
+    lease = index_store.Lease(root, versions[0])
+    _publish_versions(root, 4)
+
+    assert versions[0] not in index_store.collect_garbage(root, keep=2)
+    lease.release()
+    assert versions[0] in index_store.collect_garbage(root, keep=2)
+
+
+def test_gc_prunes_expired_leases(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    versions = _publish_versions(root, 1)
+    lease = index_store.Lease(root, versions[0])
+    _publish_versions(root, 4)
+    os.utime(lease._lease_file, (0, 0))
+
+    assert versions[0] in index_store.collect_garbage(root, keep=2)
+
+
+def test_gc_keeps_unpublished_builds(tmp_path):
+    root = str(tmp_path)
+    building, path = index_store.new_snapshot(root)
+    _publish_versions(root, 4)
+
+    assert building not in index_store.collect_garbage(root, keep=0)
+    assert os.path.isdir(path)
+
+
+def test_gc_removes_abandoned_builds(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    abandoned, path = index_store.new_snapshot(root)
+    _publish_versions(root, 1)
+    monkeypatch.setattr(index_store, "LEASE_TTL_SECONDS", 0)
+
+    assert abandoned in index_store.collect_garbage(root)
+    assert not os.path.exists(path)
+
+
+def test_kept_alive_lease_survives_expiry(tmp_path):
+    root = str(tmp_path)
+    versions = _publish_versions(root, 1)
+    lease = index_store.Lease(root, versions[0]).keep_alive(interval=0.05)
+    os.remove(lease._lease_file)
+    time.sleep(0.2)
+    _publish_versions(root, 4)
+
+    assert versions[0] not in index_store.collect_garbage(root, keep=2)
+    lease.release()
+
+
+def test_build_lock_serializes_builders(tmp_path):
+    root = str(tmp_path)
+    events = []
+
+    def build(name):
+        with index_store.build_lock(root):
+            events.append(("start", name))
+            time.sleep(0.05)
+            events.append(("end", name))
+
+    threads = [threading.Thread(target=build, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for i in range(0, len(events), 2):
+        assert events[i][0] == "start"
+        assert events[i + 1] == ("end", events[i][1])
+
+
+def test_manifest_history_is_capped(tmp_path):
+    root = str(tmp_path)
+    versions = _publish_versions(root, 10)
+
+    assert index_store.read_manifest(root)["history"] == versions[-(index_store.KEEP_PREVIOUS + 1):]
@@ -0,0 +1,102 @@
+import numpy as np
+import pytest
+
+import retrieval_filters
+
+
+class FakeCollection:
+    def __init__(self, ids, embeddings, metadatas, documents):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.metadatas = metadatas
+        self.documents = documents
+
+    def get(self, ids=None, include=None):
+        rows = range(len(self.ids)) if ids is None else [self.ids.index(i) for i in ids]
+        return {
+            "ids": [self.ids[r] for r in rows],
+            "embeddings": [self.embeddings[r] for r in rows],
+            "metadatas": [self.metadatas[r] for r in rows],
+            "documents": [self.documents[r] for r in rows],
+        }
+
+
+@pytest.fixture
+def collection():
+    return FakeCollection(
+        ids=["a1", "a2", "c1"],
+        embeddings=np.eye(3).tolist(),
+        metadatas=[
+            {"source": "A.pdf", "page": 1, "ingested_at": 100,
+             "sources": "A.pdf;B.pdf", "pages": "A.pdf:1;B.pdf:7"},
+            {"source": "A.pdf", "page": 2, "ingested_at": 100},
+            {"source": "C.pdf", "page": 3, "ingested_at": 200},
+        ],
+        documents=["first", "second", "third"],
+    )
+
+
+@pytest.fixture
+def index(tmp_path, collection):
+    retrieval_filters.build_filter_index(collection, str(tmp_path))
+    return retrieval_filters.FilterIndex(str(tmp_path))
+
+
+def mask(index, raw, notebook_sources=None):
+    return index.mask(retrieval_filters.parse_filters(raw), notebook_sources).tolist()
+
+
+def test_parse_filters_normalizes():
+    assert retrieval_filters.parse_filters(None) is None
+    assert retrieval_filters.parse_filters({
+        "source": "A.pdf", "pages": [[1, 5], 9], "ingestedAfter": 10,
+    }) == {"sources": ["A.pdf"], "pages": [(1, 5), (9, 9)], "ingested_after": 10.0}
+
+
+def test_parse_filters_rejects_unknown_keys():
+    with pytest.raises(ValueError):
+        retrieval_filters.parse_filters({"author": "x"})
+
+
+@pytest.mark.parametrize("raw", [
+    {"pages": [[None, 5]]},
+    {"pages": [[1, [2]]]},
+    {"pages": [{"from": 1}]},
+    {"pages": [True]},
+    {"source": {"name": "A.pdf"}},
+    {"source": ["A.pdf", 3]},
+    {"notebook": [["main"]]},
+    {"ingestedAfter": [2026]},
+])
+def test_parse_filters_rejects_malformed_values(raw):
+    with pytest.raises(ValueError):
+        retrieval_filters.parse_filters(raw)
+
+
+def test_source_mask(index):
+    assert mask(index, {"source": "A.pdf"}) == [True, True, False]
+    assert mask(index, {"source": ["A.pdf", "C.pdf"]}) == [True, True, True]
+    assert mask(index, {"source": "missing.pdf"}) == [False, False, False]
+
+
+def test_merged_sources_and_pages_match(index):
+    assert mask(index, {"source": "B.pdf"}) == [True, False, False]
+    assert mask(index, {"pages": [7]}) == [True, False, False]
+
+
+def test_page_and_date_ranges(index):
+    assert mask(index, {"pages": [[2, 3]]}) == [False, True, True]
+    assert mask(index, {"ingestedAfter": 150}) == [False, False, True]
+    assert mask(index, {"source": "A.pdf", "ingestedBefore": 150}) == [True, True, False]
+
+
+def test_notebook_mask_uses_notebook_sources(index):
+    assert mask(index, {"notebook": "main"}, ["C.pdf"]) == [False, False, True]
+    assert mask(index, {"notebook": "empty"}, []) == [False, False, False]
+
+
+def test_search_scores_only_allowed_rows(index, collection):
+    results = index.search(collection, [1.0, 0.0, 0.0], 2, retrieval_filters.parse_filters({"source": "C.pdf"}))
+
+    assert [doc.page_content for doc, _ in results] == ["third"]
+    assert results[0][1] == pytest.approx(0.0)
@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "debate"
+
+    def caller():
+        results.append(flight.do("topic", fn))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=caller) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while flight._calls["topic"].waiters < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("debate", True)] * 5
+
+
+def test_call_after_finish_starts_fresh():
+    flight = SingleFlight()
+    assert flight.do("k", lambda: 1) == (1, False)
+    assert flight.do("k", lambda: 2) == (2, False)
+    assert flight.in_flight() == 0
+
+
+def test_error_reaches_leader_and_followers():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def fn():
+        started.set()
+        release.wait()
+        raise RuntimeError("ollama down")
+
+    def caller():
+        try:
+            flight.do("k", fn)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=caller)
+    follower.start()
+    while flight._calls["k"].waiters < 2:
+        time.sleep(0.01)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert errors == ["ollama down", "ollama down"]
+    assert flight.in_flight() == 0
+
+
+def test_late_joiner_replays_stream():
+    flight = SingleFlight()
+    first_sent = threading.Event()
+    release = threading.Event()
+
+    def producer():
+        yield "a"
+        first_sent.set()
+        release.wait()
+        yield "b"
+
+    early = flight.stream("k", producer)
+    assert next(early) == "a"
+    first_sent.wait()
+    late = flight.stream("k", lambda: pytest.fail("producer started twice"))
+    release.set()
+
+    assert list(early) == ["b"]
+    assert list(late) == ["a", "b"]
+
+
+def test_stream_error_reaches_followers():
+    flight = SingleFlight()
+
+    def producer():
+        yield "a"
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        list(flight.stream("k", producer))
+
+
+def test_in_flight_filters_keys():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads = [
+        threading.Thread(target=flight.do, args=((name, mode), release.wait))
+        for name, mode in (("a", "llm"), ("b", "extractive"), ("c", "extractive"))
+    ]
+    for thread in threads:
+        thread.start()
+    while flight.in_flight() < 3:
+        time.sleep(0.01)
+
+    assert flight.in_flight(lambda key: key[1] == "llm") == 1
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_running_reports_keys_in_flight():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return 1
+
+    worker = threading.Thread(target=flight.do, args=("a", slow))
+    worker.start()
+    started.wait(5)
+    assert flight.running("a")
+    assert not flight.running("b")
+    release.set()
+    worker.join(5)
+    assert not flight.running("a")
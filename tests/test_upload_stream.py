@@ -0,0 +1,85 @@
+import hashlib
+import io
+
+import pytest
+
+from upload_stream import receive_files
+
+BOUNDARY = "XBOUNDARY"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+
+def part(filename, data):
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"files\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode("utf-8") + data + b"\r\n"
+
+
+def body(*parts):
+    return io.BytesIO(b"".join(parts) + f"--{BOUNDARY}--\r\n".encode("ascii"))
+
+
+def receive(tmp_path, stream, **kwargs):
+    results = []
+    receive_files(stream, CONTENT_TYPE, str(tmp_path), lambda *args: results.append(args), **kwargs)
+    return results
+
+
+def test_files_are_written_with_checksums(tmp_path):
+    results = receive(tmp_path, body(part("a.pdf", b"AAAA"), part("b.pdf", b"BB")))
+
+    assert [(name, size, error) for name, _, size, _, error in results] == [
+        ("a.pdf", 4, None), ("b.pdf", 2, None)
+    ]
+    assert results[0][3] == hashlib.sha256(b"AAAA").hexdigest()
+    assert (tmp_path / "a.pdf").read_bytes() == b"AAAA"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.pdf", "b.pdf"]
+
+
+def test_size_limit(tmp_path):
+    results = receive(tmp_path, body(part("big.pdf", b"x" * 100)), max_file_bytes=10)
+
+    assert "limit" in results[0][4]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_unsupported_type_is_skipped(tmp_path):
+    results = receive(tmp_path, body(part("notes.txt", b"hello")))
+
+    assert results == [("notes.txt", None, 0, None, "Unsupported file type")]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_checksum_mismatch_keeps_existing_file(tmp_path):
+    (tmp_path / "My_File.pdf").write_bytes(b"GOOD")
+    expected = {"My File.pdf": hashlib.sha256(b"NEW").hexdigest()}
+
+    results = receive(tmp_path, body(part("My File.pdf", b"CORRUPT")), expected_checksums=expected)
+
+    assert results[0][4] == "Checksum mismatch"
+    assert (tmp_path / "My_File.pdf").read_bytes() == b"GOOD"
+    assert [p.name for p in tmp_path.iterdir()] == ["My_File.pdf"]
+
+
+def test_matching_checksum_replaces_file(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"OLD")
+    expected = {"a.pdf": hashlib.sha256(b"NEW").hexdigest().upper()}
+
+    results = receive(tmp_path, body(part("a.pdf", b"NEW")), expected_checksums=expected)
+
+    assert results[0][4] is None
+    assert (tmp_path / "a.pdf").read_bytes() == b"NEW"
+
+
+def test_truncated_body_leaves_no_files(tmp_path):
+    truncated = io.BytesIO(part("a.pdf", b"PARTIAL")[:-2])
+
+    with pytest.raises(ValueError):
+        receive(tmp_path, truncated)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_rejects_non_multipart(tmp_path):
+    with pytest.raises(ValueError):
+        receive_files(io.BytesIO(b""), "application/json", str(tmp_path), lambda *args: None)
@@ -0,0 +1,188 @@
+"""
+Streaming multipart upload handling
+
+Parses a multipart/form-data body incrementally straight from the request
+stream, writing each file to disk in fixed-size chunks while computing its
+SHA-256 and enforcing a per-file size limit. A callback fires as soon as
+each file is complete, so processing can start while later files are still
+being received.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 1024 * 1024
+MAX_FILE_BYTES = int(os.environ.get('MAX_UPLOAD_FILE_MB', '200')) * 1024 * 1024
+
+# Finished uploads stay queryable for this long
+PROGRESS_TTL_SECONDS = 3600
+
+
+class UploadProgress:
+    """Per-file progress of all uploads, shared between request threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._uploads = {}
+
+    def start(self, upload_id):
+        with self._lock:
+            now = time.time()
+            # Forget old uploads
+            for key in [k for k, v in self._uploads.items() if now - v['updated'] > PROGRESS_TTL_SECONDS]:
+                del self._uploads[key]
+            self._uploads[upload_id] = {'files': {}, 'status': 'uploading', 'updated': now}
+
+    def update_file(self, upload_id, name, **fields):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return
+            upload['files'].setdefault(name, {'name': name}).update(fields)
+            upload['updated'] = time.time()
+
+    def set_status(self, upload_id, status):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is not None:
+                upload['status'] = status
+                upload['updated'] = time.time()
+
+    def get(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                return None
+            return {
+                'status': upload['status'],
+                'files': [dict(f) for f in upload['files'].values()]
+            }
+
+
+def new_upload_id():
+    return uuid.uuid4().hex
+
+
+class _FileWriter:
+    """
+    Writes one uploaded file to a temporary path, then moves it into place
+
+    The file only replaces an existing one of the same name once it is
+    complete, within the size limit and matches its expected checksum.
+    """
+
+    def __init__(self, dest_dir, filename, max_bytes, expected_sha256=None):
+        self.name = filename
+        self.path = os.path.join(dest_dir, filename)
+        self.tmp_path = os.path.join(dest_dir, f".{filename}.{uuid.uuid4().hex}.part")
+        self.max_bytes = max_bytes
+        self.expected_sha256 = expected_sha256.lower() if expected_sha256 else None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+        self.error = None
+        self._file = open(self.tmp_path, 'wb')
+
+    def write(self, data):
+        if self.error:
+            return
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            self.error = f'File exceeds the {self.max_bytes // (1024 * 1024)} MB limit'
+            self._discard()
+            return
+        self.sha256.update(data)
+        self._file.write(data)
+
+    def _discard(self):
+        self._file.close()
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def finish(self):
+        if self.error:
+            return
+        if self.expected_sha256 and self.expected_sha256 != self.sha256.hexdigest():
+            self.error = 'Checksum mismatch'
+            self._discard()
+            return
+        self._file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if not self._file.closed:
+            self._discard()
+
+
+def receive_files(stream, content_type, dest_dir, on_file, on_progress=None,
+                  allowed_extensions=('.pdf',), max_file_bytes=MAX_FILE_BYTES,
+                  expected_checksums=None):
+    """
+    Stream every file of a multipart body to dest_dir
+
+    Args:
+        stream: Raw request body stream
+        content_type: Request Content-Type header (carries the boundary)
+        dest_dir: Directory to write files into
+        on_file: Called as on_file(name, path, size, sha256, error) when a
+            file part ends; error is None on success
+        on_progress: Optional on_progress(name, bytes_received) callback
+        allowed_extensions: File parts with other extensions are skipped
+        max_file_bytes: Per-file size limit
+        expected_checksums: Optional dict of SHA-256 hex digests keyed by the
+            file name as sent by the client; a file that does not match is
+            discarded without touching any existing file of the same name
+
+    Raises:
+        ValueError: If the body is not multipart/form-data
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    if mimetype != 'multipart/form-data' or 'boundary' not in options:
+        raise ValueError('Expected a multipart/form-data body')
+
+    expected_checksums = expected_checksums or {}
+    os.makedirs(dest_dir, exist_ok=True)
+    decoder = MultipartDecoder(options['boundary'].encode('latin-1'))
+    writer = None
+    skipping = None
+
+    try:
+        while True:
+            data = stream.read(CHUNK_SIZE)
+            decoder.receive_data(data or None)
+            event = decoder.next_event()
+            while not isinstance(event, (NeedData, Epilogue)):
+                if isinstance(event, File):
+                    filename = secure_filename(event.filename or '')
+                    if filename.lower().endswith(tuple(allowed_extensions)):
+                        expected = expected_checksums.get(event.filename) or expected_checksums.get(filename)
+                        writer = _FileWriter(dest_dir, filename, max_file_bytes, expected)
+                    else:
+                        skipping = event.filename or event.name
+                elif isinstance(event, Data):
+                    if writer is not None:
+                        writer.write(event.data)
+                        if on_progress:
+                            on_progress(writer.name, writer.size)
+                        if not event.more_data:
+                            writer.finish()
+                            on_file(writer.name, writer.path, writer.size,
+                                    writer.sha256.hexdigest(), writer.error)
+                            writer = None
+                    elif skipping is not None and not event.more_data:
+                        on_file(skipping, None, 0, None, 'Unsupported file type')
+                        skipping = None
+                event = decoder.next_event()
+            if isinstance(event, Epilogue) or not data:
+                break
+    finally:
+        if writer is not None:
+            writer.abort()